@@ -43,6 +43,30 @@ class SpeechRecWidget(QtWidgets.QWidget):
         )
         self.layout.addWidget(self.myPauseTime, 1, 0)
 
+        self.semanticEndpointing = LocalizedCheckbox(configKey="semantic_endpointing", text="Wait longer when a sentence doesn't sound finished")
+        self.layout.addWidget(self.semanticEndpointing, 2, 0, 1, 3)
+
+        self.splitDuration = LabeledInput(
+            "Split long sentences after (in seconds)",
+            data="10",
+            configKey="utterance_split_duration",
+            info="Long sentences are split at a natural pause after roughly this long, so the translation can start sooner.\nSet to 0 to disable."
+        )
+        self.layout.addWidget(self.splitDuration, 3, 0)
+
+        self.echoSuppression = LocalizedCheckbox(configKey="echo_suppression", text="Ignore our own synthesized voice if it gets picked up again")
+        self.layout.addWidget(self.echoSuppression, 4, 0, 1, 3)
+
+        self.pushToTalk = LocalizedCheckbox(configKey="push_to_talk", text="Push-to-talk (hold the mic button or the hotkey while speaking)")
+        self.layout.addWidget(self.pushToTalk, 5, 0, 1, 3)
+
+        self.pushToTalkHotkey = LabeledInput(
+            "Push-to-talk hotkey",
+            data="",
+            configKey="push_to_talk_hotkey",
+            info="A single character (like t) or a key name (like f8, ctrl_r or caps_lock) that works even when PolyEcho isn't focused.\nLeave empty to only use the mic button."
+        )
+        self.layout.addWidget(self.pushToTalkHotkey, 6, 0)
 
 
         self.theirEnergyThreshold = LabeledInput(
@@ -78,9 +102,46 @@ class LocalWidgets(QtWidgets.QWidget):
 
         self.layout.addWidget(self.VRAMlabel, 2, 0, 1, 3)  # add to the bottom
 
+        self.benchmarkLabel = LocalizedCenteredLabel(cacheSkip=True, wordWrap=True)
+        self.layout.addWidget(self.benchmarkLabel, 3, 0, 1, 3)
+        self.benchmarkButton = QtWidgets.QPushButton(helper.translate_ui_text("Run benchmark"))
+        self.benchmarkButton.clicked.connect(self.run_benchmark)
+        self.layout.addWidget(self.benchmarkButton, 4, 1, 1, 1)
+        from utils import benchmark
+        self.update_benchmark_label(benchmark.load_benchmark_results())
+
+        self.streamingCheckbox = LocalizedCheckbox(configKey="streaming_recognition", text="Translate long sentences while they're still being spoken")
+        self.layout.addWidget(self.streamingCheckbox, 5, 0, 1, 3)
+
+        self.partialTranscriptsCheckbox = LocalizedCheckbox(configKey="endpointing_partial_transcripts", text="Check quick transcripts to detect when a sentence is over")
+        self.layout.addWidget(self.partialTranscriptsCheckbox, 6, 0, 1, 3)
+
         #for i in range(3):
             #self.layout.setColumnStretch(i, 1)
 
+    def run_benchmark(self):
+        from interpreterComponents.recognizer import RecognizerService
+        if RecognizerService.refCount > 0:
+            msgBox = QtWidgets.QMessageBox()
+            msgBox.setText(helper.translate_ui_text("Please stop the interpretation before running the benchmark."))
+            msgBox.exec()
+            return
+        benchmarkDialog = BenchmarkDialog()
+        benchmarkDialog.exec()
+        benchmarkData = benchmarkDialog.benchmarkData
+        if benchmarkData is not None and benchmarkData["recommended"] is not None:
+            self.slider.sl.setSliderPosition(helper.modelSizes.index(benchmarkData["recommended"]["modelSize"]))
+        self.update_benchmark_label(benchmarkData)
+
+    def update_benchmark_label(self, benchmarkData:Optional[dict]):
+        if benchmarkData is None or benchmarkData["recommended"] is None:
+            labelText = "Run the benchmark to find out which model size your computer can handle (only downloaded models are tested)."
+        else:
+            recommended = benchmarkData["recommended"]
+            labelText = f"Recommended: {recommended['modelSize']} on {recommended['device']} ({recommended['computeType']}), " \
+                        f"{round(recommended['rtf'], 2)}x real-time, using {recommended['memoryGB']}GB."
+        self.benchmarkLabel.setText(labelText)
+
     def update_memory_label(self):
         import torch
         if not torch.cuda.is_available():
@@ -110,6 +171,23 @@ class WhisperWidgets(QtWidgets.QWidget):
             protected=True
         )
         self.layout.addWidget(self.api_key, 0, 1, 1, 1)
+
+        self.upload_codec = ToggleButton(
+            "Upload format",
+            ["FLAC", "Opus"],
+            [lambda: None, lambda: None],
+            info="The format the audio is compressed to before being sent to OpenAI.<br>FLAC is lossless, Opus is much smaller and better suited for slow connections.",
+            configKey="online_audio_codec"
+        )
+        self.layout.addWidget(self.upload_codec, 1, 1, 1, 1)
+
+        self.max_in_flight = LabeledInput(
+            "Concurrent requests",
+            configKey="online_max_in_flight",
+            data="3",
+            info="How many utterances can be sent to OpenAI at the same time.<br>Higher values help keep up with fast conversations, results are still delivered in order."
+        )
+        self.layout.addWidget(self.max_in_flight, 2, 1, 1, 1)
         # Set empty stretchable spacers in the first and third columns
         self.layout.setColumnStretch(0, 1)
         self.layout.setColumnStretch(2, 1)
@@ -279,6 +357,16 @@ class ConfigDialog(LocalizedDialog):
 
         currentRow += 1
 
+        self.translation_memory = LocalizedCheckbox(configKey="translation_memory", text="Remember translations of repeated phrases")
+        self.layout.addWidget(self.translation_memory, currentRow, 0, 1, 3)
+
+        currentRow += 1
+
+        self.translation_hedging = LocalizedCheckbox(configKey="translation_hedging", text="Also ask Google Translate when DeepL is slower than usual (uses extra requests)")
+        self.layout.addWidget(self.translation_hedging, currentRow, 0, 1, 3)
+
+        currentRow += 1
+
         self.audo_api_key = LabeledInput(
             "Audo API Key",
             configKey="audo_api_key",
@@ -548,6 +636,20 @@ class ConfigDialog(LocalizedDialog):
                     except ValueError:
                         errorMessage += f"\n{configKey.replace('_pause_time','')} pause time must be a number"
 
+                if configKey == "utterance_split_duration":
+                    try:
+                        if float(value) < 0:
+                            raise ValueError
+                    except ValueError:
+                        errorMessage += "\nSplit duration must be a positive number"
+
+                if configKey == "online_max_in_flight":
+                    try:
+                        if int(value) < 1:
+                            raise ValueError
+                    except ValueError:
+                        errorMessage += "\nConcurrent requests must be a positive whole number"
+
                 useKeyring = hasattr(widget,"protected") and widget.protected
 
                 if useKeyring:
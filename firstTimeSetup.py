@@ -18,6 +18,7 @@ class SetupDialog(LocalizedDialog):
         self.promptLabel = LocalizedCenteredLabel(prompt, wordWrap=True)
         self.gridLayout.addWidget(self.promptLabel, 0, 0, 1, 3)
         self.saveExit = False
+        self.benchmarkDone = False
 
         self.nextButton = QtWidgets.QPushButton(helper.translate_ui_text("Next"))
         self.nextButton.setSizePolicy(QtWidgets.QSizePolicy.Policy.Preferred, QtWidgets.QSizePolicy.Policy.Minimum)
@@ -61,6 +62,7 @@ class SetupDialog(LocalizedDialog):
 
     def check_settings(self):
         errorMessage = ""
+        runBenchmark = False
 
         newSettings = copy.deepcopy(settings)
         for widget in self.iterate_widgets(self.gridLayout):
@@ -104,6 +106,9 @@ class SetupDialog(LocalizedDialog):
                     if not modelFound:
                         ModelDownloadDialog("Downloading model...", modelSize).exec()
 
+                    #Work out the fastest way to run it on this machine, once everything is validated and saved.
+                    runBenchmark = True
+
                 if configKey == "deepl_api_key" and hasattr(self, 'deepl_toggle') and self.deepl_toggle.get_value() == 0:
                     deeplTranslator = helper.get_deepl_translator(value, exitOnFail=False)
                     if deeplTranslator is None:
@@ -156,6 +161,12 @@ class SetupDialog(LocalizedDialog):
             for key, value in newSettings.items():
                 settings[key] = value
             helper.dump_settings()
+
+            #The benchmark saves its own results into the settings, and might need the ElevenLabs key to make its sample,
+            #so it has to come after the save. closeEvent checks the settings again, hence the flag.
+            if runBenchmark and not self.benchmarkDone:
+                self.benchmarkDone = True
+                BenchmarkDialog().exec()
             return True
 
     def closeEvent(self, event):
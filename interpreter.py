@@ -10,8 +10,9 @@ from PyQt6.QtCore import QObject, pyqtSignal
 
 from interpreterComponents.cloner import Cloner, ClonerParams
 from interpreterComponents.detector import Detector, DetectorParams
-from interpreterComponents.recognizer import Recognizer, RecognizerParams
+from interpreterComponents.recognizer import Recognizer, RecognizerParams, RecognizerService
 from interpreterComponents.synthetizer import Synthesizer, SynthesizerParams
+from interpreterComponents.translationService import TranslationService
 from interpreterComponents.translator import Translator, TranslatorParams
 from utils import helper
 
@@ -20,15 +21,6 @@ class Interpreter(QObject):
     GIL = threading.Lock()
     textReadySignal = pyqtSignal(object)
     cloneProgressSignal = pyqtSignal(str)
-    wRecognizer:Optional[Recognizer] = None
-    wRecognizerThread:Optional[threading.Thread] = None
-
-    @staticmethod
-    def init_wrecognizer(params:RecognizerParams):
-        if Interpreter.wRecognizer is None:
-            if params.apiKey is not None or params.modelSize is not None:
-                Interpreter.wRecognizer = Recognizer(params)
-                Interpreter.wRecognizerThread = threading.Thread(target=Interpreter.wRecognizer.main_loop)
 
     #def __init__(self, audioInput: str, audioOutput: str, settings: dict, targetLang: str, voiceIDOrName: str, srSettings:tuple,createNewVoice: bool=False):
     def __init__(self, recognizerParams:RecognizerParams, detectorParams:DetectorParams, translatorParams:TranslatorParams, synthesizerParams:SynthesizerParams, clonerParams:ClonerParams=None):
@@ -39,10 +31,18 @@ class Interpreter(QObject):
         self.ttsQueue = queue.Queue()
         self.tlQueue = queue.Queue()
         self.cloneQueue = queue.Queue() if clonerParams is not None else None
+        self.recognizer:Optional[Recognizer] = None
+        self.detector:Optional[Detector] = None
+        self.translator:Optional[Translator] = None
 
-        self._init_detector(recognizerParams, detectorParams)
-        self._init_translator(translatorParams)
-        self._init_synthetizer(synthesizerParams, clonerParams)
+        try:
+            self._init_detector(recognizerParams, detectorParams)
+            self._init_translator(translatorParams)
+            self._init_synthetizer(synthesizerParams, clonerParams)
+        except Exception:
+            #The shared services were already acquired, and stop_interpretation never gets called on a half built interpreter.
+            self.release_services()
+            raise
 
 
     def _init_detector(self, recognizerParams:RecognizerParams, detectorParams:DetectorParams):
@@ -50,15 +50,18 @@ class Interpreter(QObject):
         if recognizerParams.runLocal:
             helper.logger.debug(f"Using {recognizerParams.modelSize} for faster-whisper")
 
-        with Interpreter.GIL:
-            Interpreter.init_wrecognizer(recognizerParams)
+        #The recognizer is shared between interpreters and kept loaded between sessions.
+        self.recognizer = RecognizerService.acquire(recognizerParams)
 
 
         # Initialize the detector...
         #self.detector = Detector(inputDeviceName=audioInput,
         #                         srSettings=srSettings, tlQueue=self.tlQueue, cloneQueue=self.cloneQueue,
         #                         audioQueue=Interpreter.wRecognizer.audioQueue)
-        self.detector = Detector(detectorParams, tlQueue=self.tlQueue, audioQueue=Interpreter.wRecognizer.audioQueue, cloneQueue=self.cloneQueue)
+        self.detector = Detector(detectorParams, tlQueue=self.tlQueue, audioQueue=self.recognizer.audioQueue, cloneQueue=self.cloneQueue,
+                                 partialTranscriber=self.recognizer.transcribe_partial if recognizerParams.runLocal else None)
+        #Lets the recognizer know whether it's worth waiting for this speaker's utterance to batch it with another one.
+        self.recognizer.add_speaker(self.detector.speaker, self.detector.is_speaking)
 
         self.interruptEvents.append(self.detector.interruptEvent)
 
@@ -91,32 +94,30 @@ class Interpreter(QObject):
         for thread in self.threads:
             thread.start()
 
-        if Interpreter.wRecognizerThread is not None and not Interpreter.wRecognizerThread.is_alive():
-            Interpreter.wRecognizerThread.start()
-
         helper.log_usage_info("After begin interpretation")
 
     def set_interrupts(self):
-        with Interpreter.GIL:
-            if Interpreter.wRecognizer is not None:
-                Interpreter.wRecognizer.interruptEvent.set()
-
         for event in self.interruptEvents:
             event.set()
 
 
     def stop_interpretation(self):
-        with Interpreter.GIL:
-            if Interpreter.wRecognizer is not None:
-                if Interpreter.wRecognizerThread.is_alive():
-                    Interpreter.wRecognizerThread.join()
-
-                Interpreter.wRecognizer = None
-                Interpreter.wRecognizerThread = None
-
         for thread in self.threads:
             thread.join()
 
+        self.release_services()
+
+    def release_services(self):
+        if self.recognizer is not None:
+            if self.detector is not None:
+                self.recognizer.remove_speaker(self.detector.speaker)
+            RecognizerService.release()
+            self.recognizer = None
+
+        if self.translator is not None:
+            TranslationService.release()
+            self.translator = None
+
 
     def wait_for_clone(self):
         newVoiceID = self.cloner.main_loop(self.cloneProgressSignal)
@@ -137,6 +138,18 @@ class Interpreter(QObject):
         else:
             self.detector.isRunning.set()
 
+    @property
+    def talking(self):
+        #Only used in push-to-talk mode.
+        return self.detector.talkEvent.is_set()
+
+    @talking.setter
+    def talking(self, value):
+        if value:
+            self.detector.talkEvent.set()
+        else:
+            self.detector.talkEvent.clear()
+
     @property
     def synthetizer_paused(self):
         return not self.detector.isRunning.is_set()
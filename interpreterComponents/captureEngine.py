@@ -0,0 +1,462 @@
+import collections
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import sounddevice
+from faster_whisper.vad import get_vad_model
+
+from interpreterComponents.melFeatures import IncrementalMelExtractor, hopLength
+from utils import helper
+
+#Silero VAD was trained on 512/1024/1536 sample windows at 16kHz. 512 gives us 32ms of resolution.
+vadWindowSize = 512
+vadWindowDuration = vadWindowSize / helper.whisperSampleRate
+#How much raw audio the PortAudio callback can get ahead of the processing thread before we start losing it.
+rawBufferDuration = 10
+#How much 16kHz audio is kept around. Utterances are views into this buffer, so it has to comfortably outlast
+#the longest phrase plus however long it sits in the queues.
+utteranceBufferDuration = 180
+#The noise floor is this percentile of the energies of the last noiseFloorDuration seconds of non-speech windows.
+#Using a low percentile rather than the mean keeps it from jumping on the odd bit of speech the VAD misses.
+noiseFloorDuration = 10
+noiseFloorPercentile = 20
+#A window has to be this many times louder than the noise floor to count as speech.
+noiseFloorRatio = 2.0
+noiseFloorsPath = os.path.join(helper.cacheDir, "noise_floors.json")
+noiseFloorsLock = threading.Lock()
+#Long utterances are split at the quietest window within this many seconds before the split duration is reached.
+splitSearchDuration = 3.0
+#Speech spans handed to the recognizer get padded and merged the same way faster-whisper's own VAD filter does it.
+speechPadDuration = 0.4
+minSilenceDuration = 2.0
+
+class CaptureTimeoutError(Exception):
+    pass
+
+@dataclass
+class Utterance:
+    audio: np.ndarray               #float32 16kHz, a view into the capture engine's ring buffer.
+    speechTimestamps: list[dict]    #faster-whisper style {"start", "end"} sample spans of the speech within the audio.
+    continues: bool = False         #The utterance was split while the speaker was still going, the next one carries on from here.
+    features: Optional[np.ndarray] = None   #Whisper's input features for the speech spans, if they were computed while capturing.
+
+class AudioRingBuffer:
+    #Preallocated ring buffer where every sample is written twice (at i and i+capacity), so any range up to capacity
+    #samples long can be returned as a single contiguous view, no matter where it wraps around.
+    #Positions are absolute sample counts since the buffer was created.
+    def __init__(self, capacity:int):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity * 2, dtype=np.float32)
+        self.writeCount = 0
+
+    def write(self, samples:np.ndarray):
+        if samples.shape[0] > self.capacity:
+            self.writeCount += samples.shape[0] - self.capacity
+            samples = samples[-self.capacity:]
+        start = self.writeCount % self.capacity
+        firstPart = min(samples.shape[0], self.capacity - start)
+        self.buffer[start:start + firstPart] = samples[:firstPart]
+        self.buffer[start + self.capacity:start + self.capacity + firstPart] = samples[:firstPart]
+        remaining = samples.shape[0] - firstPart
+        if remaining > 0:
+            self.buffer[:remaining] = samples[firstPart:]
+            self.buffer[self.capacity:self.capacity + remaining] = samples[firstPart:]
+        self.writeCount += samples.shape[0]     #Only updated once the data is in place, so readers never see a partial write.
+
+    def view(self, startPosition:int, endPosition:int) -> np.ndarray:
+        if endPosition - startPosition > self.capacity or startPosition < self.writeCount - self.capacity:
+            raise ValueError("Requested audio is no longer in the ring buffer.")
+        start = startPosition % self.capacity
+        return self.buffer[start:start + endPosition - startPosition]
+
+class NoiseFloorTracker:
+    #Running percentile over the energies of the most recent background windows. It starts out filled with the floor from the last
+    #session on this device (if there is one), which then gets replaced as real audio comes in.
+    def __init__(self, deviceName:str):
+        self.deviceName = deviceName
+        self.energies = np.full(int(noiseFloorDuration / vadWindowDuration), np.nan, dtype=np.float32)
+        self.writeCount = 0
+        savedFloor = self.load_floors().get(deviceName)
+        if savedFloor is not None:
+            helper.logger.debug(f"Starting {deviceName} from a saved noise floor of {savedFloor:.1f}.")
+            self.energies[:] = savedFloor
+        self.floor = savedFloor
+
+    def update(self, energies:np.ndarray) -> Optional[float]:
+        if energies.shape[0] == 0:
+            return self.floor
+        energies = energies[-self.energies.shape[0]:]
+        indexes = (self.writeCount + np.arange(energies.shape[0])) % self.energies.shape[0]
+        self.energies[indexes] = energies
+        self.writeCount += energies.shape[0]
+        self.floor = float(np.nanpercentile(self.energies, noiseFloorPercentile))
+        return self.floor
+
+    @staticmethod
+    def load_floors() -> dict:
+        if not os.path.exists(noiseFloorsPath):
+            return dict()
+        try:
+            with open(noiseFloorsPath, "r", encoding="utf8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError) as e:
+            helper.logger.warning(f"Couldn't read the saved noise floors: {e}")
+            return dict()
+
+    def save(self):
+        if self.floor is None:
+            return
+        with noiseFloorsLock:
+            floors = self.load_floors()
+            floors[self.deviceName] = self.floor
+            os.makedirs(helper.cacheDir, exist_ok=True)
+            with open(noiseFloorsPath, "w", encoding="utf8") as fp:
+                json.dump(floors, fp, indent=4)
+        helper.logger.debug(f"Saved noise floor of {self.floor:.1f} for {self.deviceName}.")
+
+class PolyphaseResampler:
+    #Streaming rational resampler (like scipy's resample_poly, without needing scipy). The anti-aliasing filter is a
+    #Kaiser-windowed sinc split into one sub-filter per output phase, and each block is filtered in a single vectorised
+    #gather + dot product. The last few input samples are kept so consecutive blocks line up exactly.
+    def __init__(self, inputRate:int, outputRate:int, tapsPerPhase:int=32):
+        divisor = math.gcd(int(inputRate), int(outputRate))
+        self.up = int(outputRate) // divisor
+        self.down = int(inputRate) // divisor
+        self.tapsPerPhase = tapsPerPhase
+
+        filterLength = tapsPerPhase * self.up
+        cutoff = 1 / max(self.up, self.down)
+        taps = np.arange(filterLength) - (filterLength - 1) / 2
+        prototype = cutoff * np.sinc(cutoff * taps) * np.kaiser(filterLength, 8.0) * self.up
+        #phaseFilters[phase] holds every up-th tap starting from phase, reversed so it lines up with the input in order.
+        self.phaseFilters = np.ascontiguousarray(prototype.reshape(tapsPerPhase, self.up).T[:, ::-1], dtype=np.float32)
+
+        self.history = np.zeros(tapsPerPhase - 1, dtype=np.float32)
+        self.inputCount = 0
+        self.outputCount = 0
+
+    def process(self, block:np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return block
+        buffer = np.concatenate([self.history, block])
+        bufferStart = self.inputCount - self.history.shape[0]
+
+        #Every output sample whose newest input sample has arrived.
+        outputEnd = ((self.inputCount + block.shape[0]) * self.up + self.down - 1) // self.down
+        outputPositions = np.arange(self.outputCount, outputEnd, dtype=np.int64) * self.down
+        inputIndexes = outputPositions // self.up - bufferStart
+        gatherIndexes = inputIndexes[:, np.newaxis] + np.arange(-self.tapsPerPhase + 1, 1)
+        output = np.einsum("ij,ij->i", buffer[gatherIndexes], self.phaseFilters[outputPositions % self.up])
+
+        self.outputCount = outputEnd
+        self.inputCount += block.shape[0]
+        self.history = buffer[-(self.tapsPerPhase - 1):]
+        return output.astype(np.float32)
+
+class CaptureEngine:
+    #Turns a microphone into utterances. PortAudio pushes audio into a ring buffer from its callback, so nothing is lost if
+    #the processing thread falls behind for a bit. The processing thread resamples it to 16kHz into a second ring buffer,
+    #scores it with vectorised numpy maths and the Silero VAD model that ships with faster-whisper, and returns utterances
+    #as views into that buffer (including the pre-roll before speech was detected).
+    def __init__(self, deviceInfo:dict, energyThreshold:float, pauseThreshold:float, vadThreshold:float=0.5,
+                 preRollDuration:float=0.5, minSpeechDuration:float=0.25, computeFeatures:bool=False):
+        self.deviceInfo = deviceInfo
+        self.sampleRate = self.get_capture_rate(deviceInfo)
+        self.energyThreshold = energyThreshold    #The minimum, the actual gate follows the noise floor above it.
+        self.noiseFloor = NoiseFloorTracker(deviceInfo["name"])
+        self.pauseThreshold = pauseThreshold
+        self.vadThreshold = vadThreshold
+        self.preRollWindows = int(math.ceil(preRollDuration / vadWindowDuration))
+        self.minSpeechWindows = int(math.ceil(minSpeechDuration / vadWindowDuration))
+        self.trailingWindows = self.preRollWindows    #How much of the pause to keep at the end of an utterance.
+
+        self.vadModel = get_vad_model()
+        self.vadState = self.vadModel.get_initial_state(batch_size=1)
+        self.resampler = PolyphaseResampler(self.sampleRate, helper.whisperSampleRate)
+
+        self.rawBuffer = AudioRingBuffer(self.sampleRate * rawBufferDuration)
+        self.rawReadPosition = 0
+        self.audioBuffer = AudioRingBuffer(helper.whisperSampleRate * utteranceBufferDuration)
+        self.windowPosition = 0     #Start of the next window that hasn't been classified yet.
+        #Only worth it for local recognition, it lets the recognizer go straight to the encoder.
+        self.melExtractor = IncrementalMelExtractor(self.audioBuffer) if computeFeatures else None
+        self.dataReady = threading.Event()
+        self.stream = None
+        self.continuationStart = None   #Where the next utterance picks up if the last one was split while still being spoken.
+        self.continuationRuns = list()  #Speech after the split point that was already classified.
+        self.inPhrase = False           #Whether someone's speaking right now, but the utterance hasn't been returned yet.
+        #Windows are handed out one by one through this generator, so anything left over from a block when an utterance ends
+        #is simply picked up by the next listen() call.
+        self.windows = self.iterate_windows()
+
+    @staticmethod
+    def get_capture_rate(deviceInfo:dict) -> int:
+        #Capture at 16kHz directly if the device supports it, otherwise use its native rate and resample.
+        try:
+            sounddevice.check_input_settings(device=deviceInfo["index"], samplerate=helper.whisperSampleRate, channels=1, dtype="float32")
+            helper.logger.debug(f"Device {deviceInfo['index']} supports {helper.whisperSampleRate}Hz, capturing at that rate.")
+            return helper.whisperSampleRate
+        except Exception as e:
+            helper.logger.debug(f"Device {deviceInfo['index']} doesn't support {helper.whisperSampleRate}Hz ({e}), resampling from {deviceInfo['default_samplerate']}Hz.")
+            return int(deviceInfo["default_samplerate"])
+
+    def __enter__(self):
+        self.stream = sounddevice.InputStream(device=self.deviceInfo["index"], samplerate=self.sampleRate, channels=1,
+                                              dtype="float32", callback=self.audio_callback)
+        self.stream.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stream.stop()
+        self.stream.close()
+        self.stream = None
+        self.noiseFloor.save()
+
+    def audio_callback(self, indata:np.ndarray, frames:int, timeInfo, status:sounddevice.CallbackFlags):
+        #Runs on the PortAudio thread, so it only copies the audio into place.
+        if status.input_overflow:
+            helper.logger.warning(f"Input overflow on device {self.deviceInfo['index']}.")
+        self.rawBuffer.write(indata[:, 0])
+        self.dataReady.set()
+
+    def discard_pending(self):
+        #Throws away everything captured so far that hasn't been processed yet (for example while muted).
+        self.rawReadPosition = self.rawBuffer.writeCount
+        self.windowPosition = self.audioBuffer.writeCount
+        self.windows = self.iterate_windows()
+        self.continuationStart = None
+        self.continuationRuns = list()
+        if self.melExtractor is not None:
+            self.melExtractor.reset(self.audioBuffer.writeCount)
+
+    def read_windows(self, timeout:float=1.0) -> Optional[int]:
+        #Moves whatever the callback has captured so far into the 16kHz buffer.
+        #Returns how many full windows are now available from windowPosition onwards, or None if no audio came in.
+        if not self.dataReady.wait(timeout):
+            return None
+        self.dataReady.clear()
+
+        writePosition = self.rawBuffer.writeCount
+        if writePosition - self.rawReadPosition > self.rawBuffer.capacity:
+            helper.logger.warning(f"Capture fell behind by {(writePosition - self.rawReadPosition) / self.sampleRate:.1f}s, skipping ahead.")
+            self.rawReadPosition = writePosition - self.rawBuffer.capacity
+        if writePosition > self.rawReadPosition:
+            self.audioBuffer.write(self.resampler.process(self.rawBuffer.view(self.rawReadPosition, writePosition)))
+            self.rawReadPosition = writePosition
+            if self.melExtractor is not None:
+                self.melExtractor.update()
+
+        return (self.audioBuffer.writeCount - self.windowPosition) // vadWindowSize
+
+    def classify_windows(self, windows:np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        #Returns the loudness (on the same scale as the energy threshold), VAD speech probability and speech flag for each window.
+        energies = np.sqrt(np.mean(np.square(windows), axis=1)) * 32768
+        speechProbs = np.zeros(windows.shape[0], dtype=np.float32)
+        for index in range(windows.shape[0]):
+            speechProb, self.vadState = self.vadModel(windows[index:index+1], self.vadState, helper.whisperSampleRate)
+            speechProbs[index] = float(np.squeeze(speechProb))
+        #Only windows the VAD thinks are background go into the noise floor, or a long monologue would raise it to speech level.
+        self.noiseFloor.update(energies[speechProbs < self.vadThreshold])
+        isSpeech = (speechProbs >= self.vadThreshold) & (energies > self.get_gate())
+        return energies, speechProbs, isSpeech
+
+    def iterate_windows(self):
+        #Yields (windowPosition, energy, speechProb, isSpeech) for every window, classifying each block in one go.
+        #windowPosition is None if no audio came in for a while, so listen() can still check its timeout.
+        while True:
+            windowCount = self.read_windows()
+            if windowCount is None:
+                yield None, 0.0, 0.0, False
+                continue
+            if windowCount == 0:
+                continue
+            startPosition = self.windowPosition
+            self.windowPosition = startPosition + windowCount * vadWindowSize
+            windows = self.audioBuffer.view(startPosition, self.windowPosition).reshape(windowCount, vadWindowSize)
+            energies, speechProbs, isSpeech = self.classify_windows(windows)
+            for index in range(windowCount):
+                yield startPosition + index * vadWindowSize, energies[index], speechProbs[index], isSpeech[index]
+
+    def get_gate(self) -> float:
+        if self.noiseFloor.floor is None:
+            return self.energyThreshold
+        return max(self.noiseFloor.floor * noiseFloorRatio, self.energyThreshold)
+
+    @staticmethod
+    def get_speech_timestamps(speechRuns:list, phraseStart:int, phraseEnd:int) -> list[dict]:
+        #Pads the runs of speech windows, merges the ones separated by short pauses, and makes them relative to the utterance.
+        #The span edges are snapped to whisper's 10ms frame grid, so the precomputed features line up with them.
+        padSamples = int(speechPadDuration * helper.whisperSampleRate)
+        speechTimestamps = list()
+        for runStart, runEnd in speechRuns:
+            start = -(-max(runStart - padSamples, phraseStart) // hopLength) * hopLength - phraseStart
+            end = min(runEnd + padSamples, phraseEnd) // hopLength * hopLength - phraseStart
+            if end <= start:
+                continue
+            if len(speechTimestamps) > 0 and start - speechTimestamps[-1]["end"] < minSilenceDuration * helper.whisperSampleRate:
+                speechTimestamps[-1]["end"] = max(end, speechTimestamps[-1]["end"])
+            else:
+                speechTimestamps.append({"start": start, "end": end})
+        return speechTimestamps
+
+    def make_utterance(self, speechRuns:list, phraseStart:int, phraseEnd:int, continues:bool) -> Utterance:
+        speechTimestamps = self.get_speech_timestamps(speechRuns, phraseStart, phraseEnd)
+        features = None
+        if self.melExtractor is not None:
+            features = self.melExtractor.get_features(phraseStart, speechTimestamps)
+        self.inPhrase = continues
+        return Utterance(self.audioBuffer.view(phraseStart, phraseEnd), speechTimestamps, continues, features)
+
+    def record(self, talkEvent:threading.Event, timeout:Optional[float]=None, preRollDuration:float=0.2, splitDuration:Optional[float]=None) -> Utterance:
+        #Push-to-talk: returns everything captured while talkEvent is set, with no VAD or endpointing involved.
+        #The audio keeps getting pulled into the 16kHz buffer while waiting, so there's a bit of pre-roll from before the press.
+        #If the key is held for longer than splitDuration (or half the ring buffer, whichever is shorter), the recording is cut
+        #at the quietest recent window and the next call carries on from there, so it never outgrows the buffer.
+        maxSamples = self.audioBuffer.capacity // 2
+        if splitDuration:
+            maxSamples = min(int(splitDuration * helper.whisperSampleRate), maxSamples)
+        waitStart = time.monotonic()
+        while True:
+            isContinuation = self.continuationStart is not None
+            if isContinuation:
+                #The key was still held when the last piece was cut.
+                phraseStart = self.continuationStart
+            else:
+                while not talkEvent.wait(0.05):
+                    self.read_windows(timeout=0)
+                    if timeout and time.monotonic() - waitStart > timeout:
+                        raise CaptureTimeoutError("listening timed out while waiting for push-to-talk")
+                phraseStart = max(self.audioBuffer.writeCount - int(preRollDuration * helper.whisperSampleRate), self.audioBuffer.writeCount - self.audioBuffer.capacity, 0)
+            self.inPhrase = True
+            while talkEvent.is_set() and self.audioBuffer.writeCount - phraseStart < maxSamples:
+                self.read_windows(timeout=0.05)
+
+            continues = talkEvent.is_set()
+            if continues:
+                phraseEnd = self.find_split_position(phraseStart, phraseStart + maxSamples)
+                helper.logger.debug(f"Splitting {(phraseEnd - phraseStart) / helper.whisperSampleRate:.1f}s push-to-talk recording that's still going.")
+                self.continuationStart = phraseEnd
+            else:
+                self.read_windows(timeout=0)    #Whatever came in right before the release.
+                phraseEnd = self.audioBuffer.writeCount
+                self.continuationStart = None
+
+            #None of this went through the VAD, so the window iterator starts over after it.
+            self.windowPosition = phraseEnd
+            self.windows = self.iterate_windows()
+            self.continuationRuns = list()
+            #The tail end of a split recording is kept no matter how short, it's part of what was said.
+            if continues or isContinuation or phraseEnd - phraseStart >= self.minSpeechWindows * vadWindowSize:
+                return self.make_utterance([[phraseStart, phraseEnd]], phraseStart, phraseEnd, continues)
+            self.inPhrase = False
+            helper.logger.debug("Push-to-talk press was too short, ignoring it.")
+
+    def find_split_position(self, phraseStart:int, phraseEnd:int) -> int:
+        #The middle of the quietest window in the last splitSearchDuration seconds before phraseEnd.
+        #Never in the first half though, or a short split could keep getting cut at the same pause.
+        searchStart = max(phraseEnd - int(splitSearchDuration * helper.whisperSampleRate), (phraseStart + phraseEnd) // 2)
+        windowCount = (phraseEnd - searchStart) // vadWindowSize
+        if windowCount == 0:
+            return phraseEnd
+        windows = self.audioBuffer.view(searchStart, searchStart + windowCount * vadWindowSize).reshape(windowCount, vadWindowSize)
+        return searchStart + int(np.argmin(np.mean(np.square(windows), axis=1))) * vadWindowSize + vadWindowSize // 2
+
+    def listen(self, timeout:Optional[float]=None, phraseTimeLimit:Optional[float]=None,
+               chunkDuration:Optional[float]=None, onChunk:Optional[Callable[[np.ndarray], None]]=None, endpointer=None,
+               splitDuration:Optional[float]=None) -> Utterance:
+        #Waits for an utterance and returns it as float32 16kHz audio. If onChunk is set, it's called with the utterance so far
+        #every chunkDuration seconds while the speaker is still talking.
+        #If an Endpointer is given it decides when a pause ends the utterance, otherwise it's a fixed pauseThreshold.
+        #Utterances longer than splitDuration are cut at the quietest recent window, and the next call carries on from the cut.
+        #The returned arrays are views into the ring buffer, which stay valid for utteranceBufferDuration seconds.
+        phraseStart = None
+        elapsedTime = 0.0
+        silentWindows = 0
+        speechWindows = 0
+        lastChunkEnd = 0
+        recentEnergies = collections.deque(maxlen=int(splitSearchDuration / vadWindowDuration))
+        speechRuns = list()     #[start, end] of every run of consecutive speech windows, as absolute positions.
+        if self.continuationStart is not None:
+            phraseStart = lastChunkEnd = self.continuationStart
+            speechWindows = self.minSpeechWindows     #The speech was already confirmed before the split.
+            speechRuns = self.continuationRuns
+            self.continuationStart = None
+            self.continuationRuns = list()
+
+        for windowPosition, energy, speechProb, isSpeech in self.windows:
+            if windowPosition is None:
+                elapsedTime += 1.0 if phraseStart is None else 0.0
+                if timeout and elapsedTime > timeout:
+                    raise CaptureTimeoutError("listening timed out while waiting for phrase to start")
+                continue
+            windowEnd = windowPosition + vadWindowSize
+
+            if phraseStart is None:
+                elapsedTime += vadWindowDuration
+                if timeout and elapsedTime > timeout:
+                    raise CaptureTimeoutError("listening timed out while waiting for phrase to start")
+                if isSpeech:
+                    #The pre-roll is just whatever is already in the buffer before this window.
+                    phraseStart = max(windowPosition - (self.preRollWindows - 1) * vadWindowSize, self.audioBuffer.writeCount - self.audioBuffer.capacity, 0)
+                    speechWindows = 1
+                    silentWindows = 0
+                    lastChunkEnd = phraseStart
+                    recentEnergies.clear()
+                    speechRuns = [[windowPosition, windowEnd]]
+                    self.inPhrase = True
+                    if endpointer is not None:
+                        endpointer.reset()
+                        endpointer.add_speech_window(self.audioBuffer.view(windowPosition, windowEnd), energy)
+                continue
+
+            if isSpeech:
+                speechWindows += 1
+                silentWindows = 0
+                if len(speechRuns) > 0 and speechRuns[-1][1] == windowPosition:
+                    speechRuns[-1][1] = windowEnd
+                else:
+                    speechRuns.append([windowPosition, windowEnd])
+                if endpointer is not None:
+                    endpointer.add_speech_window(self.audioBuffer.view(windowPosition, windowEnd), energy)
+            else:
+                silentWindows += 1
+                if endpointer is not None:
+                    endpointer.add_silent_window(speechProb)
+            recentEnergies.append((windowPosition, energy))
+
+            phraseDuration = (windowEnd - phraseStart) / helper.whisperSampleRate
+            if silentWindows == 0:
+                pauseOver = False
+            elif endpointer is not None:
+                pauseOver = endpointer.should_end(silentWindows * vadWindowDuration, lambda: self.audioBuffer.view(phraseStart, windowEnd))
+            else:
+                pauseOver = silentWindows * vadWindowDuration > self.pauseThreshold
+            phraseOver = pauseOver or (phraseTimeLimit and phraseDuration > phraseTimeLimit)
+            if phraseOver:
+                if speechWindows < self.minSpeechWindows:
+                    #Too short to be speech (a click or a cough), go back to waiting.
+                    phraseStart = None
+                    self.inPhrase = False
+                    continue
+                phraseEnd = windowEnd - max(silentWindows - self.trailingWindows, 0) * vadWindowSize
+                return self.make_utterance(speechRuns, phraseStart, phraseEnd, False)
+
+            if splitDuration and silentWindows == 0 and phraseDuration > splitDuration:
+                #Anything already sent off as a chunk can't be moved into the next piece anymore.
+                candidates = [(candidateEnergy, candidatePosition) for candidatePosition, candidateEnergy in recentEnergies if candidatePosition >= lastChunkEnd]
+                if len(candidates) > 0:
+                    splitPosition = min(candidates)[1] + vadWindowSize // 2
+                    helper.logger.debug(f"Splitting {(splitPosition - phraseStart) / helper.whisperSampleRate:.1f}s utterance that's still going.")
+                    self.continuationStart = splitPosition
+                    self.continuationRuns = [[max(runStart, splitPosition), runEnd] for runStart, runEnd in speechRuns if runEnd > splitPosition]
+                    return self.make_utterance(speechRuns, phraseStart, splitPosition, True)
+
+            if onChunk is not None and silentWindows == 0 and (windowEnd - lastChunkEnd) / helper.whisperSampleRate >= chunkDuration:
+                lastChunkEnd = windowEnd
+                onChunk(self.audioBuffer.view(phraseStart, windowEnd))
@@ -5,6 +5,7 @@ import threading
 from dataclasses import dataclass
 from typing import Union
 
+import numpy as np
 import requests
 import io
 
@@ -40,7 +41,7 @@ class Cloner:
     def main_loop(self, cloneProgressSignal:pyqtSignal):
         while True:
             try:
-                wavData:Union[bytes,str] = self.cloneQueue.get(timeout=10)
+                audioData:Union[np.ndarray,str] = self.cloneQueue.get(timeout=10)
             except queue.Empty:
                 continue
             finally:
@@ -49,8 +50,8 @@ class Cloner:
                     return None
             helper.logger.debug("Recieved audioSegment to clean.")
 
-            if isinstance(wavData, bytes):
-                threading.Thread(target=self.clean_audio, args=(wavData, cloneProgressSignal)).start()
+            if isinstance(audioData, np.ndarray):
+                threading.Thread(target=self.clean_audio, args=(audioData, cloneProgressSignal)).start()
             else:
                 helper.logger.debug("We have enough audio data to create a clone.")
                 cloneProgressSignal.emit(f"PROCESSING")
@@ -90,15 +91,15 @@ class Cloner:
                 cloneProgressSignal.emit(f"COMPLETE")
                 return newVoiceID
 
-    def clean_audio(self, wavBytes:bytes, cloneProgressSignal:pyqtSignal):
-
+    def clean_audio(self, audioData:np.ndarray, cloneProgressSignal:pyqtSignal):
+        audio = AudioSegment(data=helper.float32_to_pcm(audioData), sample_width=2, frame_rate=helper.whisperSampleRate, channels=1)
         #TODO: Remove the saving stuff. It's purely for testing.
         i = 0
         while os.path.exists(f"Original_{i}.wav"):
             i += 1
 
         with open(f"Original_{i}.wav", "wb") as fp:
-            fp.write(wavBytes)
+            audio.export(fp, format="wav")
 
         #TODO: REMOVE THIS DEBUG INSTANT CLONING. DEBUG BYPASS.
         if os.path.exists(f"Prefab-_0.wav"):
@@ -121,7 +122,6 @@ class Cloner:
 
 
         helper.logger.debug(f"Processing audio {i}.")
-        audio = AudioSegment.from_file_using_temporary_files(io.BytesIO(wavBytes))
         audio = effects.normalize(audio)
         target_dBFS = -20
         normalizedAudio:AudioSegment = audio.apply_gain(target_dBFS - audio.dBFS)
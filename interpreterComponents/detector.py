@@ -1,43 +1,75 @@
 import datetime
 import gc
+import itertools
 import logging
 import os
 import platform
 import queue
 import threading
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
 
 import faster_whisper
-import speech_recognition as sr
+import numpy as np
 import openai
 
+from interpreterComponents.captureEngine import CaptureEngine, CaptureTimeoutError
+from interpreterComponents.echoSuppressor import EchoSuppressor, EchoSuppressionParams
+from interpreterComponents.endpointer import Endpointer, EndpointerParams
 from utils import helper
 
 
 @dataclass
 class DetectorParams:
     inputDevice: str
-    energy_threshold: int
-    dynamic_energy_threshold: bool
+    energy_threshold: int   #Minimum loudness, the detector raises it above the noise floor as needed.
     pause_threshold: float
+    streaming: bool = False #Send the audio to the recognizer in chunks while the phrase is still being spoken.
+    streamChunkDuration: float = 1.0
+    speaker: str = "default"    #Used by the recognition scheduler to give each speaker their own queue.
+    schedulerWeight: float = 1.0
+    vadThreshold: float = 0.5   #Silero VAD speech probability above which a frame counts as speech.
+    semanticEndpointing: bool = True    #Scale the pause needed to end an utterance by how finished it sounds.
+    partialTranscripts: bool = False    #Let the endpointer check a quick transcript when it's unsure (local recognition only).
+    splitDuration: float = 10.0 #Utterances longer than this get split at a natural pause, so they can be processed in pieces. 0 disables it.
+    echoSuppression: bool = True    #Discard utterances that are just our own synthesized audio coming back.
+    computeFeatures: bool = False   #Compute whisper's input features while capturing (only useful with local recognition).
+    pushToTalk: bool = False    #Only capture while talkEvent is set, and send it off the moment it's cleared.
     def __post_init__(self):
+        self.splitDuration = float(self.splitDuration)
         if isinstance(self.energy_threshold, str):
             self.energy_threshold = int(self.energy_threshold)
 
         if isinstance(self.pause_threshold, str):
             self.pause_threshold = float(self.pause_threshold)
 class Detector:
-    GDL = threading.Lock()
-    def __init__(self, params:DetectorParams, tlQueue:queue.Queue, audioQueue:queue.Queue, cloneQueue:Optional[queue.Queue]=None):
+    streamIDCounter = itertools.count()
+    continuationIDCounter = itertools.count()
+    def __init__(self, params:DetectorParams, tlQueue:queue.Queue, audioQueue:queue.Queue, cloneQueue:Optional[queue.Queue]=None,
+                 partialTranscriber:Optional[Callable[[np.ndarray, str], str]]=None):
         self.microphoneInfo = helper.get_portaudio_device_info_from_name(params.inputDevice, "input")
-        self.srMic = sr.Microphone(device_index=self.microphoneInfo["index"], sample_rate=int(self.microphoneInfo["default_samplerate"]))
-        self.srRecognizer = sr.Recognizer()
-        self.srRecognizer.non_speaking_duration = 0.5
         helper.logger.debug(f"Starting detector with settings: {params}")
-        self.srRecognizer.energy_threshold = params.energy_threshold
-        self.srRecognizer.dynamic_energy_threshold = params.dynamic_energy_threshold
-        self.srRecognizer.pause_threshold = params.pause_threshold
+        self.energyThreshold = params.energy_threshold
+        self.pauseThreshold = params.pause_threshold
+        self.vadThreshold = params.vadThreshold
+        self.pushToTalk = params.pushToTalk
+        self.talkEvent = threading.Event()
+        self.streaming = params.streaming and not self.pushToTalk
+        self.streamChunkDuration = params.streamChunkDuration
+        self.speaker = params.speaker
+        self.schedulerWeight = params.schedulerWeight
+        self.splitDuration = params.splitDuration
+        self.continuationID = None
+        self.captureEngine:Optional[CaptureEngine] = None
+        self.echoSuppressor = EchoSuppressor(EchoSuppressionParams()) if params.echoSuppression else None
+        self.computeFeatures = params.computeFeatures
+        self.endpointer = None
+        if params.semanticEndpointing:
+            if partialTranscriber is not None and params.partialTranscripts:
+                speakerTranscriber = lambda audio: partialTranscriber(audio, self.speaker)
+            else:
+                speakerTranscriber = None
+            self.endpointer = Endpointer(EndpointerParams(pauseThreshold=self.pauseThreshold, vadThreshold=self.vadThreshold), speakerTranscriber)
 
         self.interruptEvent = threading.Event()
         self.isRunning = threading.Event()  #This one stops audio detection entirely when cleared.
@@ -50,38 +82,99 @@ class Detector:
 
 
     def main_loop(self):
-        Detector.GDL.acquire()
-        with self.srMic as source:
-            self.srRecognizer.adjust_for_ambient_noise(source)
-            Detector.GDL.release()
-
+        captureEngine = CaptureEngine(self.microphoneInfo, energyThreshold=self.energyThreshold, pauseThreshold=self.pauseThreshold, vadThreshold=self.vadThreshold,
+                                      computeFeatures=self.computeFeatures and not self.streaming)
+        self.captureEngine = captureEngine
+        with captureEngine:
             while True:
-                self.isRunning.wait()  #Wait until we're running. This ensures that we don't accidentally record while muted.
+                if not self.isRunning.is_set():
+                    self.isRunning.wait()  #Wait until we're running. This ensures that we don't accidentally record while muted.
+                    captureEngine.discard_pending()     #The mic kept capturing while we were muted, drop all of that.
                 helper.logger.debug("Detecting audio...")
+                streamState = {"streamID": None, "sentSamples": 0, "echo": False}
+                #Every piece of a split utterance shares the same continuation ID, so they can be stitched back together.
+                if self.continuationID is None:
+                    self.continuationID = next(Detector.continuationIDCounter)
                 try:
-                    audio:sr.AudioData = self.srRecognizer.listen(source, timeout=20, phrase_time_limit=60)
-                    #If you manage to speak a single sentence longer than 1 minute, congrats and f*** you.
-                    #This is to force it to exit in cases with high background noise, which gets detected as speech.
-                    #I have no idea what a better fix would be.
-                except sr.WaitTimeoutError:
+                    if self.pushToTalk:
+                        #Short timeout so we can still notice the interrupt while nobody's pressing anything.
+                        utterance = captureEngine.record(self.talkEvent, timeout=1, splitDuration=self.splitDuration)
+                    else:
+                        utterance = captureEngine.listen(timeout=20, phraseTimeLimit=60,
+                                                     chunkDuration=self.streamChunkDuration, onChunk=(lambda phraseAudio: self.queue_stream_chunk(phraseAudio, streamState)) if self.streaming else None,
+                                                     endpointer=self.endpointer, splitDuration=self.splitDuration)
+                        #If you manage to speak a single sentence longer than 1 minute, congrats and f*** you.
+                        #This is to force it to exit in cases with high background noise, which gets detected as speech.
+                        #The limit only applies if splitting is turned off.
+                except CaptureTimeoutError:
                     continue
                 finally:
                     if self.interruptEvent.is_set():
                         helper.logger.debug("Detector exiting...")
                         break
 
-                helper.logger.debug(f"Audio detected on {self.srMic.device_index}.")
-                audioData = {
-                    "audio":audio.get_wav_data(),
-                    "queue":self.resultQueue,
-                    "endTime": datetime.datetime.now()
-                }
+                helper.logger.debug(f"Audio detected on {self.microphoneInfo['index']}.")
+                audio = utterance.audio
+                isEcho = streamState["echo"] or self.is_echo(audio)
+                if self.streaming:
+                    if isEcho:
+                        #Chunks sent before the echo was noticed still need their stream closed, but nothing else gets sent.
+                        if streamState["streamID"] is not None:
+                            self.queue_audio(audio[:0], {"streamID": streamState["streamID"], "final": True, "discard": True})
+                    else:
+                        finalData = {"streamID": self.get_stream_id(streamState), "final": True}
+                        if self.cloneQueue is not None:
+                            finalData["cloneaudio"] = np.array(audio, copy=True)     #Same as in queue_audio.
+                        self.queue_audio(audio[streamState["sentSamples"]:], finalData)
+                elif not isEcho:
+                    #The recognizer uses these instead of running the VAD and feature extraction over the audio again.
+                    utteranceData = {"speechTimestamps": utterance.speechTimestamps}
+                    if utterance.features is not None:
+                        utteranceData["features"] = utterance.features
+                    self.queue_audio(audio, utteranceData)
+                if not utterance.continues:
+                    self.continuationID = None
+
+    def is_speaking(self) -> bool:
+        #Whether an utterance has started that the recognizer hasn't got yet.
+        return self.captureEngine is not None and self.captureEngine.inPhrase and self.isRunning.is_set() and not self.interruptEvent.is_set()
+
+    @staticmethod
+    def get_stream_id(streamState:dict) -> int:
+        if streamState["streamID"] is None:
+            streamState["streamID"] = next(Detector.streamIDCounter)
+        return streamState["streamID"]
+
+    def is_echo(self, audio:np.ndarray) -> bool:
+        return self.echoSuppressor is not None and self.echoSuppressor.is_echo(audio)
+
+    def queue_stream_chunk(self, phraseAudio:np.ndarray, streamState:dict):
+        #Sends off the part of the phrase that hasn't been sent yet, while it's still being spoken.
+        if streamState["echo"] or self.is_echo(phraseAudio):
+            streamState["echo"] = True
+            return
+        self.queue_audio(phraseAudio[streamState["sentSamples"]:], {"streamID": self.get_stream_id(streamState), "final": False})
+        streamState["sentSamples"] = phraseAudio.shape[0]
+
+    def queue_audio(self, audio:np.ndarray, extraData:Optional[dict]=None):
+        #The capture engine hands out views into its ring buffer, which gets overwritten once it wraps around.
+        #The recognizer can fall far enough behind for that to happen, so whatever gets queued is copied.
+        audioData = {
+            "audio":np.array(audio, copy=True),
+            "queue":self.resultQueue,
+            "endTime": datetime.datetime.now(),
+            "speaker": self.speaker,
+            "weight": self.schedulerWeight,
+            "continuationID": self.continuationID
+        }
 
-                if self.cloneQueue is not None:
-                    audioData["clonequeue"] = self.cloneQueue
+        if self.cloneQueue is not None:
+            audioData["clonequeue"] = self.cloneQueue
 
-                if self.audioQueue is not None:
-                    self.audioQueue.put_nowait(audioData)
-                else:
-                    helper.logger.warning("wRecognizer is none.")
+        if extraData is not None:
+            audioData.update(extraData)
 
+        if self.audioQueue is not None:
+            self.audioQueue.put_nowait(audioData)
+        else:
+            helper.logger.warning("wRecognizer is none.")
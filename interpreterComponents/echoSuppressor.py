@@ -0,0 +1,135 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import sounddevice
+
+from interpreterComponents.captureEngine import AudioRingBuffer, PolyphaseResampler
+from utils import helper
+
+#How much played audio is kept around to compare utterances against.
+referenceDuration = 60
+#Blocks quieter than this (float32 RMS) don't count as something having been played.
+activityThreshold = 1e-4
+#The echo detection compares loudness envelopes rather than raw waveforms, which survives call codecs and room acoustics.
+envelopeFrameSize = 320     #20ms at 16kHz.
+
+@dataclass
+class EchoSuppressionParams:
+    maxDelay: float = 2.0       #Longest delay (in seconds) between something being played and it being heard again.
+    threshold: float = 0.8      #Envelope correlation above which an utterance counts as an echo.
+    shortThreshold: float = 0.92    #Short utterances can match by chance, so they need a closer match.
+    shortDuration: float = 2.0
+    minOverlap: float = 0.5     #The utterance has to overlap at least this many seconds of actual playback to be checked.
+
+class PlaybackReference:
+    #Everything the synthesizers play, at 16kHz, with the time it was played. It's captured from the other end of the
+    #virtual cable the synthesizers play into, so it's exactly what the call receives.
+    def __init__(self):
+        self.buffer = AudioRingBuffer(helper.whisperSampleRate * referenceDuration)
+        self.lock = threading.Lock()
+        self.lastWriteTime = time.monotonic()
+        self.lastActiveTime = None
+        self.taps = dict()      #deviceName: [stream, refCount]
+        self.tapLock = threading.Lock()
+
+    def write(self, audio:np.ndarray):
+        with self.lock:
+            self.buffer.write(audio)
+            self.lastWriteTime = time.monotonic()
+            if audio.shape[0] > 0 and np.sqrt(np.mean(np.square(audio))) > activityThreshold:
+                self.lastActiveTime = self.lastWriteTime
+
+    def get_recent(self, duration:float) -> Optional[np.ndarray]:
+        #Returns (a copy of) the last duration seconds of playback, or None if nothing was played in that time.
+        with self.lock:
+            if self.lastActiveTime is None or time.monotonic() - self.lastActiveTime > duration:
+                return None
+            sampleCount = min(int(duration * helper.whisperSampleRate), self.buffer.writeCount, self.buffer.capacity)
+            #The tap may not have delivered the most recent block yet, pad so the timeline still ends at "now".
+            missingCount = min(int((time.monotonic() - self.lastWriteTime) * helper.whisperSampleRate), sampleCount)
+            recentAudio = self.buffer.view(self.buffer.writeCount - sampleCount + missingCount, self.buffer.writeCount).copy()
+        return np.concatenate([recentAudio, np.zeros(missingCount, dtype=np.float32)])
+
+    def start_tap(self, deviceName:str):
+        #Starts capturing from the loopback device. Taps are reference counted, since both synthesizers play into the same cable.
+        with self.tapLock:
+            if deviceName in self.taps:
+                self.taps[deviceName][1] += 1
+                return
+            deviceInfo = helper.get_portaudio_device_info_from_name(deviceName, "input")
+            sampleRate = int(deviceInfo["default_samplerate"])
+            resampler = PolyphaseResampler(sampleRate, helper.whisperSampleRate)
+            def tap_callback(indata:np.ndarray, frames:int, timeInfo, status:sounddevice.CallbackFlags):
+                self.write(resampler.process(indata[:, 0]))
+
+            stream = sounddevice.InputStream(device=deviceInfo["index"], samplerate=sampleRate, channels=1, dtype="float32", callback=tap_callback)
+            try:
+                stream.start()
+            except sounddevice.PortAudioError:
+                stream.close()
+                raise
+            helper.logger.debug(f"Capturing playback reference from {deviceName}.")
+            self.taps[deviceName] = [stream, 1]
+
+    def stop_tap(self, deviceName:str):
+        with self.tapLock:
+            if deviceName not in self.taps:
+                return
+            self.taps[deviceName][1] -= 1
+            if self.taps[deviceName][1] > 0:
+                return
+            stream = self.taps.pop(deviceName)[0]
+            stream.stop()
+            stream.close()
+
+playbackReference = PlaybackReference()
+
+class EchoSuppressor:
+    #Checks whether an utterance is just something we played ourselves coming back (through the call, or from the speakers
+    #into the mic), so it doesn't get transcribed, translated and synthesized all over again.
+    def __init__(self, params:EchoSuppressionParams, reference:PlaybackReference=playbackReference):
+        self.params = params
+        self.reference = reference
+        self.suppressedCount = 0
+
+    def is_echo(self, audio:np.ndarray) -> bool:
+        #audio is assumed to have just ended, so it's matched against the playback of the last (duration + maxDelay) seconds.
+        utteranceDuration = audio.shape[0] / helper.whisperSampleRate
+        referenceAudio = self.reference.get_recent(utteranceDuration + self.params.maxDelay)
+        if referenceAudio is None:
+            return False
+
+        utteranceEnvelope = self.get_envelope(audio)
+        referenceEnvelope = self.get_envelope(referenceAudio)
+        frameCount = utteranceEnvelope.shape[0]
+        if frameCount < 2 or referenceEnvelope.shape[0] < frameCount:
+            return False
+        if np.count_nonzero(referenceEnvelope > activityThreshold) * envelopeFrameSize / helper.whisperSampleRate < self.params.minOverlap:
+            return False
+
+        #Pearson correlation of the utterance envelope against every possible delay, in one go.
+        candidates = np.lib.stride_tricks.sliding_window_view(referenceEnvelope, frameCount)
+        candidates = candidates - candidates.mean(axis=1, keepdims=True)
+        utteranceEnvelope = utteranceEnvelope - utteranceEnvelope.mean()
+        norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(utteranceEnvelope)
+        correlations = np.divide(candidates @ utteranceEnvelope, norms, out=np.zeros(candidates.shape[0]), where=norms > 0)
+
+        bestIndex = int(np.argmax(correlations))
+        threshold = self.params.threshold if utteranceDuration >= self.params.shortDuration else self.params.shortThreshold
+        if correlations[bestIndex] < threshold:
+            return False
+        self.suppressedCount += 1
+        delay = (candidates.shape[0] - 1 - bestIndex) * envelopeFrameSize / helper.whisperSampleRate
+        helper.logger.warning(f"Discarding {utteranceDuration:.1f}s utterance, it matches our own playback from {delay:.2f}s earlier "
+                              f"(correlation {correlations[bestIndex]:.2f}, {self.suppressedCount} suppressed so far).")
+        return True
+
+    @staticmethod
+    def get_envelope(audio:np.ndarray) -> np.ndarray:
+        #RMS of every 20ms frame. It's kept linear so the correlation follows the loud parts, and low level noise barely matters.
+        frameCount = audio.shape[0] // envelopeFrameSize
+        frames = audio[:frameCount * envelopeFrameSize].reshape(frameCount, envelopeFrameSize)
+        return np.sqrt(np.mean(np.square(frames), axis=1))
@@ -0,0 +1,123 @@
+import collections
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+
+from interpreterComponents.captureEngine import vadWindowDuration
+from utils import helper
+
+#Pitch search range for the autocorrelation, covers pretty much every speaking voice.
+minPitch = 70
+maxPitch = 400
+#How many of the most recent speech windows the energy and pitch trends are measured over (~0.4s).
+trendWindows = 12
+terminalPunctuation = re.compile(r"[.?!。？！…]['\")\]]*$")
+continuationWords = {"and", "but", "or", "so", "because", "the", "a", "an", "to", "of", "with", "that", "which", "if", "when"}
+
+@dataclass
+class EndpointerParams:
+    pauseThreshold: float               #The pause needed when there's no evidence either way.
+    minPauseFactor: float = 0.5         #The shortest pause that can end an utterance, as a fraction of pauseThreshold.
+    maxPauseFactor: float = 2.5         #After this long it's over no matter what.
+    vadThreshold: float = 0.5
+    def __post_init__(self):
+        self.pauseThreshold = float(self.pauseThreshold)
+
+class Endpointer:
+    #Decides when a pause ends the utterance. Rather than a fixed silence timer, the pause needed scales between
+    #minPauseFactor and maxPauseFactor times the pause threshold depending on how finished the utterance sounds:
+    #how confidently the VAD hears silence, whether the energy and pitch were falling going into the pause
+    #and, if a partial transcriber is given, whether a quick transcript of the utterance ends in terminal punctuation.
+    def __init__(self, params:EndpointerParams, partialTranscriber:Optional[Callable[[np.ndarray], str]]=None):
+        self.params = params
+        self.partialTranscriber = partialTranscriber
+        self.minPause = params.pauseThreshold * params.minPauseFactor
+        self.maxPause = params.pauseThreshold * params.maxPauseFactor
+        self.reset()
+
+    def reset(self):
+        self.energies = collections.deque(maxlen=trendWindows)
+        self.pitches = collections.deque(maxlen=trendWindows)
+        self.silenceProbs = list()
+        self.transcriptScore = None
+
+    def add_speech_window(self, window:np.ndarray, energy:float):
+        self.energies.append(20 * math.log10(max(energy, 1.0)))
+        pitch = self.estimate_pitch(window)
+        if pitch is not None:
+            self.pitches.append(12 * math.log2(pitch))
+        #Speech resumed, so whatever we worked out about the last pause no longer applies.
+        self.silenceProbs.clear()
+        self.transcriptScore = None
+
+    def add_silent_window(self, speechProb:float):
+        self.silenceProbs.append(speechProb)
+
+    def should_end(self, silentDuration:float, getPhraseAudio:Callable[[], np.ndarray]) -> bool:
+        if silentDuration < self.minPause:
+            return False
+        if silentDuration >= self.maxPause:
+            return True
+
+        score = self.get_acoustic_score()
+        if self.partialTranscriber is not None and 0.25 < score < 0.75:
+            #Only worth transcribing when the acoustics can't make up their mind, and only once per pause.
+            if self.transcriptScore is None:
+                self.transcriptScore = self.get_transcript_score(getPhraseAudio())
+            score = (score + self.transcriptScore) / 2
+
+        requiredPause = self.minPause + (self.maxPause - self.minPause) * (1 - score)
+        if silentDuration >= requiredPause:
+            helper.logger.debug(f"Ending utterance after a {silentDuration:.2f}s pause (completion score {score:.2f}).")
+            return True
+        return False
+
+    def get_acoustic_score(self) -> float:
+        #How likely the utterance is to be over, 0.5 being no idea.
+        #A VAD probability that stays close to the threshold usually means a breath or hesitation rather than silence.
+        vadScore = 1 - min(float(np.mean(self.silenceProbs)) / self.params.vadThreshold, 1.0) if len(self.silenceProbs) > 0 else 0.5
+        #Energy (in dB per second) and pitch (in semitones per second) tend to fall at the end of a sentence.
+        energyScore = np.clip(0.5 - self.get_slope(self.energies) / 60, 0, 1)
+        pitchScore = np.clip(0.5 - self.get_slope(self.pitches) / 20, 0, 1)
+        return float(0.4 * vadScore + 0.3 * energyScore + 0.3 * pitchScore)
+
+    def get_transcript_score(self, phraseAudio:np.ndarray) -> float:
+        try:
+            text = self.partialTranscriber(phraseAudio).strip()
+        except Exception as e:
+            helper.logger.warning(f"Partial transcript for endpointing failed: {e}")
+            return 0.5
+        helper.logger.debug(f"Partial transcript for endpointing: {text}")
+        if text == "":
+            return 0.5
+        if terminalPunctuation.search(text):
+            return 1.0
+        lastWord = "".join(char for char in text.split()[-1].lower() if char.isalnum())
+        if text.endswith(",") or lastWord in continuationWords:
+            return 0.0
+        return 0.5
+
+    @staticmethod
+    def get_slope(values:collections.deque) -> float:
+        if len(values) < 3:
+            return 0.0
+        times = np.arange(len(values)) * vadWindowDuration
+        return float(np.polyfit(times, np.asarray(values), 1)[0])
+
+    @staticmethod
+    def estimate_pitch(window:np.ndarray) -> Optional[float]:
+        #Autocorrelation pitch estimate, returns None for unvoiced windows.
+        window = window - np.mean(window)
+        spectrum = np.fft.rfft(window, 2 * window.shape[0])
+        autocorrelation = np.fft.irfft(np.abs(spectrum) ** 2)[:window.shape[0]]
+        if autocorrelation[0] <= 0:
+            return None
+        minLag = helper.whisperSampleRate // maxPitch
+        maxLag = helper.whisperSampleRate // minPitch
+        lag = minLag + int(np.argmax(autocorrelation[minLag:maxLag]))
+        if autocorrelation[lag] / autocorrelation[0] < 0.3:
+            return None
+        return helper.whisperSampleRate / lag
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import deepl
+import googletrans
+
+from utils import helper
+
+#Maps whatever whisper reports as the language (a code locally, a name from the API) to the code each provider wants.
+#Building it needs a couple of DeepL requests, so it's built once per process and saved, and only rebuilt when it's stale.
+languageRoutesPath = os.path.join(helper.cacheDir, "language_routes.json")
+languageRoutesTTL = 7 * 24 * 3600
+languageRoutesLock = threading.Lock()
+#Whisper codes that google translate knows under a different one.
+googleCodeAliases = {"zh": "zh-cn"}
+
+class LanguageRoutes:
+    #Every table maps a lowercase alias (code, name, or name without the variant in parentheses) to {"code", "name"}.
+    def __init__(self, tables:dict):
+        self.tables = tables
+
+    @property
+    def has_deepl(self) -> bool:
+        return "deeplSource" in self.tables
+
+    def get_deepl_source(self, language:str) -> Optional[str]:
+        route = self.tables.get("deeplSource", {}).get(language.lower())
+        return route["code"] if route is not None else None
+
+    def get_deepl_target(self, code:str, name:str) -> Optional[dict]:
+        deepLTargets = self.tables.get("deeplTarget", {})
+        return deepLTargets.get(code.lower(), deepLTargets.get(name.lower()))
+
+    def get_google_source(self, language:str) -> str:
+        route = self.tables["google"].get(language.lower())
+        return route["code"] if route is not None else "auto"
+
+    def get_google_target(self, code:str, name:str) -> Optional[dict]:
+        return self.tables["google"].get(code.lower(), self.tables["google"].get(name.lower()))
+
+    @staticmethod
+    def build_table(languages:list[tuple[str, str]]) -> dict:
+        table = dict()
+        for code, name in languages:
+            route = {"code": code.lower(), "name": name.lower()}
+            table.setdefault(code.lower(), route)
+            table.setdefault(name.lower(), route)
+            if "(" in name:
+                #"English (American)" also answers to "english", the first variant listed wins.
+                table.setdefault(name[:name.index("(")].strip().lower(), route)
+        return table
+
+    @classmethod
+    def build(cls, deepLTranslator:Optional[deepl.Translator]) -> "LanguageRoutes":
+        tables = {"created": time.time(), "google": cls.build_table(list(googletrans.LANGUAGES.items()))}
+        for alias, code in googleCodeAliases.items():
+            tables["google"].setdefault(alias, tables["google"][code])
+        if deepLTranslator is not None:
+            tables["deeplSource"] = cls.build_table([(language.code, language.name) for language in deepLTranslator.get_source_languages()])
+            tables["deeplTarget"] = cls.build_table([(language.code, language.name) for language in deepLTranslator.get_target_languages()])
+            #Whisper's names for the languages are the same as google's, so those work for DeepL too.
+            for alias, route in list(tables["google"].items()):
+                deepLRoute = tables["deeplSource"].get(route["code"].split("-")[0])
+                if deepLRoute is not None:
+                    tables["deeplSource"].setdefault(alias, deepLRoute)
+        return cls(tables)
+
+    @staticmethod
+    def load() -> Optional[dict]:
+        if not os.path.exists(languageRoutesPath):
+            return None
+        try:
+            with open(languageRoutesPath, "r", encoding="utf8") as fp:
+                return json.load(fp)
+        except (OSError, ValueError) as e:
+            helper.logger.warning(f"Couldn't read the saved language routes: {e}")
+            return None
+
+    def save(self):
+        os.makedirs(helper.cacheDir, exist_ok=True)
+        with open(languageRoutesPath, "w", encoding="utf8") as fp:
+            json.dump(self.tables, fp, indent=4, ensure_ascii=False)
+
+languageRoutes:Optional[LanguageRoutes] = None
+
+def get_language_routes(deepLTranslator:Optional[deepl.Translator]) -> LanguageRoutes:
+    #Both translators share the same routes, and only the first one to get here (per process) might have to build them.
+    global languageRoutes
+    with languageRoutesLock:
+        needsDeepL = deepLTranslator is not None
+        if languageRoutes is None or (needsDeepL and not languageRoutes.has_deepl):
+            tables = LanguageRoutes.load()
+            if tables is not None and time.time() - tables.get("created", 0) < languageRoutesTTL and (not needsDeepL or "deeplSource" in tables):
+                languageRoutes = LanguageRoutes(tables)
+            else:
+                helper.logger.debug("Building the language routing table.")
+                languageRoutes = LanguageRoutes.build(deepLTranslator)
+                try:
+                    languageRoutes.save()
+                except OSError as e:
+                    helper.logger.warning(f"Couldn't save the language routes: {e}")
+        return languageRoutes
@@ -0,0 +1,67 @@
+import math
+from typing import Optional
+
+import numpy as np
+from faster_whisper.feature_extractor import FeatureExtractor
+
+from utils import helper
+
+#Same framing as whisper: 25ms windows every 10ms, 80 mel bins, 30s per encoder pass.
+hopLength = 160
+fftSize = 400
+maxFrames = 3000
+#Unnormalized frames for this many seconds of audio are kept, which matches the utterance buffer.
+frameBufferDuration = 180
+
+class IncrementalMelExtractor:
+    #Computes whisper's log-mel frames while the audio comes in, so they're ready as soon as the utterance ends.
+    #Frame k is centered on absolute sample k * hopLength of the capture engine's 16kHz buffer. The frames are stored before
+    #whisper's per-input normalization (which depends on the loudest frame of the whole input), that's applied in get_features.
+    def __init__(self, audioBuffer, startPosition:int=0):
+        self.audioBuffer = audioBuffer
+        self.melFilters = FeatureExtractor(feature_size=80, sampling_rate=helper.whisperSampleRate, hop_length=hopLength, n_fft=fftSize).mel_filters.T
+        self.window = np.hanning(fftSize + 1)[:-1].astype(np.float32)
+        self.capacity = frameBufferDuration * helper.whisperSampleRate // hopLength
+        self.frames = np.zeros((self.capacity, self.melFilters.shape[1]), dtype=np.float32)
+        self.nextFrame = math.ceil((startPosition + fftSize // 2) / hopLength)    #Next frame that hasn't been computed yet.
+
+    def reset(self, startPosition:int):
+        #Skips ahead (for example after audio was discarded while muted).
+        self.nextFrame = max(self.nextFrame, math.ceil((startPosition + fftSize // 2) / hopLength))
+
+    def update(self):
+        #Computes every frame whose whole window is now in the buffer, in one go.
+        lastFrame = (self.audioBuffer.writeCount - fftSize // 2) // hopLength
+        if lastFrame < self.nextFrame:
+            return
+        oldestFrame = math.ceil((self.audioBuffer.writeCount - self.audioBuffer.capacity + fftSize // 2) / hopLength)
+        firstFrame = max(self.nextFrame, oldestFrame, lastFrame - self.capacity + 1)
+
+        audio = self.audioBuffer.view(firstFrame * hopLength - fftSize // 2, lastFrame * hopLength + fftSize // 2)
+        windows = np.lib.stride_tricks.sliding_window_view(audio, fftSize)[::hopLength] * self.window
+        powerSpectrum = np.abs(np.fft.rfft(windows, axis=1)) ** 2
+        logMel = np.log10(np.maximum(powerSpectrum @ self.melFilters, 1e-10)).astype(np.float32)
+
+        indexes = np.arange(firstFrame, lastFrame + 1) % self.capacity
+        self.frames[indexes] = logMel
+        self.nextFrame = lastFrame + 1
+
+    def get_features(self, startPosition:int, speechTimestamps:list[dict]) -> Optional[np.ndarray]:
+        #Returns whisper's input features for the given spans (relative to startPosition, on the hop grid), padded to 30s.
+        #Returns None if they don't fit in a single encoder pass, or if some of the frames aren't available.
+        self.update()
+        frameIndexes = list()
+        for span in speechTimestamps:
+            firstFrame = (startPosition + span["start"]) // hopLength
+            frameIndexes.append(np.arange(firstFrame, firstFrame + (span["end"] - span["start"]) // hopLength))
+        frameIndexes = np.concatenate(frameIndexes) if len(frameIndexes) > 0 else np.zeros(0, dtype=np.int64)
+        if frameIndexes.shape[0] == 0 or frameIndexes.shape[0] > maxFrames:
+            return None
+        if frameIndexes[-1] >= self.nextFrame or frameIndexes[0] < self.nextFrame - self.capacity:
+            return None
+
+        #Whisper pads the audio with 30s of zeros, which come out as log10(1e-10) = -10.
+        logMel = np.full((maxFrames, self.frames.shape[1]), -10.0, dtype=np.float32)
+        logMel[:frameIndexes.shape[0]] = self.frames[frameIndexes % self.capacity]
+        logMel = np.maximum(logMel, logMel.max() - 8.0)
+        return ((logMel + 4.0) / 4.0).T
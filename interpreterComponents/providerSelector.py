@@ -0,0 +1,91 @@
+import collections
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from utils import helper
+
+#Weight of the newest sample in the moving averages.
+ewmaAlpha = 0.3
+#Latency samples kept per provider and language pair, for the hedging percentile.
+latencyHistory = 50
+#Fewer samples than this and the percentile isn't trusted, so there's no hedging.
+minHedgeSamples = 5
+hedgePercentile = 90
+#The preferred provider (DeepL, the better translator) keeps getting picked unless another one is this much faster.
+preferenceFactor = 1.25
+#Every this many requests for a language pair, the one that isn't currently winning gets used anyway, so its numbers stay current.
+explorationInterval = 10
+#What a provider is assumed to cost before there are any numbers for it, in seconds.
+priorLatency = 1.0
+#Without new samples, the numbers drift halfway back to the prior every this many seconds,
+#so a provider that had a bad moment isn't written off forever (or trusted forever after a good one).
+decayHalfLife = 30
+
+class ProviderStats:
+    def __init__(self):
+        self.latency:Optional[float] = None     #EWMA, in seconds.
+        self.errorRate = 0.0                    #EWMA of failures (0-1).
+        self.latencies = collections.deque(maxlen=latencyHistory)
+        self.lastSampleTime = None
+
+    def add_sample(self, latency:float, failed:bool):
+        #The old numbers are decayed first, so a sample after a long gap counts for more than one right after another.
+        self.latency, self.errorRate = self.get_decayed()
+        self.lastSampleTime = time.monotonic()
+        self.errorRate = ewmaAlpha * float(failed) + (1 - ewmaAlpha) * self.errorRate
+        if failed:
+            return  #How fast something fails says nothing about how fast it translates.
+        self.latency = latency if self.latency is None else ewmaAlpha * latency + (1 - ewmaAlpha) * self.latency
+        self.latencies.append(latency)
+
+    def get_decayed(self) -> tuple[Optional[float], float]:
+        #The averages pulled towards the prior (and no errors) depending on how old they are.
+        if self.lastSampleTime is None:
+            return self.latency, self.errorRate
+        weight = 0.5 ** ((time.monotonic() - self.lastSampleTime) / decayHalfLife)
+        latency = None if self.latency is None else priorLatency + (self.latency - priorLatency) * weight
+        return latency, self.errorRate * weight
+
+    def get_cost(self) -> float:
+        #Expected time to get a translation out of it, counting the failures as retries.
+        latency, errorRate = self.get_decayed()
+        if latency is None:
+            latency = priorLatency      #Never got a translation out of it. Trying it is left to the exploration in rank().
+        return latency / max(1 - errorRate, 0.05)
+
+class ProviderSelector:
+    #Tracks how fast and how reliable each provider is, per language pair, and picks the one to use for each request.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = dict()             #(provider, languagePair): ProviderStats
+        self.requestCounts = collections.Counter()
+
+    def add_sample(self, provider:str, languagePair:str, latency:float, failed:bool):
+        with self.lock:
+            self.stats.setdefault((provider, languagePair), ProviderStats()).add_sample(latency, failed)
+
+    def rank(self, providers:list[str], languagePair:str) -> list[str]:
+        #Returns the providers best first. They're expected in order of preference.
+        if len(providers) < 2:
+            return providers
+        with self.lock:
+            costs = [self.stats.get((provider, languagePair), ProviderStats()).get_cost() for provider in providers]
+            costs[0] /= preferenceFactor
+            ranked = [provider for _, provider in sorted(zip(costs, providers), key=lambda item: item[0])]
+            self.requestCounts[languagePair] += 1
+            if self.requestCounts[languagePair] % explorationInterval == 0:
+                ranked = ranked[1:] + ranked[:1]
+        if ranked[0] != providers[0]:
+            helper.logger.debug(f"Routing {languagePair} to {ranked[0]} (estimated costs {dict(zip(providers, [round(cost, 2) for cost in costs]))}).")
+        return ranked
+
+    def get_hedge_delay(self, provider:str, languagePair:str) -> Optional[float]:
+        #How long to wait for the provider before firing the next one too, or None if there isn't enough data yet.
+        with self.lock:
+            stats = self.stats.get((provider, languagePair))
+            if stats is None or len(stats.latencies) < minHedgeSamples:
+                return None
+            return float(np.percentile(stats.latencies, hedgePercentile))
@@ -1,59 +1,122 @@
 import datetime
+import concurrent.futures
 import gc
 import io
 import logging
-import os
 import platform
 import queue
 import sys
 import threading
-from dataclasses import dataclass
-from typing import Optional
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
+import av
+import ctranslate2
 import faster_whisper
+import numpy as np
 import openai
-from faster_whisper.transcribe import TranscriptionInfo
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import TranscriptionInfo, Segment, get_ctranslate2_storage, get_compression_ratio, restore_speech_timestamps
+from faster_whisper.vad import get_speech_timestamps, collect_chunks
 
+from interpreterComponents.rejector import Rejector, RejectionParams
+from interpreterComponents.scheduler import RecognitionScheduler
 from utils import helper
 
+#Upper bound on how many utterances get decoded in a single batched pass.
+maxBatchSize = 8
+#While waiting for another speaker to finish their utterance, how often to check whether they still are.
+speakingPollInterval = 0.02
+#If a streamed phrase goes on this long without the hypotheses agreeing, commit what we have anyway.
+maxStreamWindow = 20
+#Formats for the online uploads, indexed by the online_audio_codec setting: (container, codec, bitrate).
+uploadFormats = [("flac", "flac", None), ("ogg", "libopus", 24000)]
+#Once a speaker's language has been detected with at least languageLockProbability this many times in a row, it's passed
+#to whisper directly instead of being detected again. Every languageRecheckInterval utterances it gets checked again anyway.
+languageLockCount = 3
+languageLockProbability = 0.9
+languageRecheckInterval = 10
+#Partial transcripts for endpointing only look at the end of the utterance.
+partialTranscriptDuration = 8
+
 @dataclass
 class RecognizerParams:
     runLocal: bool
     modelSize: Optional[str] = None
     apiKey: Optional[str] = None
+    batchWindow: float = 0.0    #How long (in seconds) to wait for more utterances to batch together. 0 disables batching.
+    uploadCodec: int = 0        #Index into uploadFormats, only used for online recognition.
+    maxInFlight: int = 1        #How many online transcription requests can run at the same time.
+    maxLatency: float = 0.0     #Utterances that can't be transcribed within this many seconds of being spoken are downgraded or dropped. 0 disables it.
+    device: Optional[str] = None        #Device and compute type picked by the benchmark. If they're not set, fall back to the defaults.
+    computeType: Optional[str] = None
+    rejectionParams: RejectionParams = field(default_factory=RejectionParams)
+    idleTimeout: float = 0.0    #How long (in seconds) to keep the model loaded once no session is using it. 0 keeps it loaded until exit.
 
 class Recognizer:
     def __init__(self, params:RecognizerParams):
+        self.params = params
         self.runLocal = params.runLocal
+        self.batchWindow = params.batchWindow
+        self.uploadFormat = uploadFormats[params.uploadCodec]
         self.model = None
         if self.runLocal:
-            if platform.system() == "Linux" or platform.system() == "Windows":
-                self.model = faster_whisper.WhisperModel(params.modelSize, device="auto", compute_type="float16")
+            if params.device is not None and params.computeType is not None:
+                helper.logger.debug(f"Loading {params.modelSize} on {params.device} with {params.computeType}.")
+                self.model = faster_whisper.WhisperModel(params.modelSize, device=params.device, compute_type=params.computeType)
+            elif platform.system() == "Linux" or platform.system() == "Windows":
+                #Not benchmarked yet. float16 only works on the GPU, int8 is the safe choice everywhere else.
+                computeType = "float16" if ctranslate2.get_cuda_device_count() > 0 else "int8"
+                self.model = faster_whisper.WhisperModel(params.modelSize, device="auto", compute_type=computeType)
             else:
                 self.model = faster_whisper.WhisperModel(params.modelSize, device="auto")
         else:
             openai.api_key = params.apiKey
 
-        self.audioQueue = queue.Queue()
+        self.audioQueue = RecognitionScheduler(maxLatency=params.maxLatency)
         self.interruptEvent = threading.Event()
+        self.streams = dict()
+        self.speakerLanguages = dict()  #speaker -> sticky language state, see get_sticky_language
+        self.speakingChecks = dict()    #speaker -> function that says whether they're mid-utterance, see gather_batch
+        self.rejector = Rejector(params.rejectionParams)
+
+        self.onlineExecutor = None
+        if not self.runLocal and params.maxInFlight > 1:
+            self.onlineExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=params.maxInFlight, thread_name_prefix="OnlineRecognizer")
+            self.inFlightSlots = threading.BoundedSemaphore(params.maxInFlight)
+            self.pendingResults = dict()    #resultQueue -> results waiting for earlier utterances of the same speaker to finish
+            self.pendingLock = threading.Lock()
+
+    def needs_rebuild(self, params:RecognizerParams) -> bool:
+        if self.runLocal != params.runLocal:
+            return True
+        if self.runLocal:
+            return (self.params.modelSize, self.params.device, self.params.computeType) != (params.modelSize, params.device, params.computeType)
+        return self.params.maxInFlight != params.maxInFlight     #Online recognizers are cheap to recreate anyway.
+
+    def update_params(self, params:RecognizerParams):
+        #Applies the settings that can change without reloading the model.
+        self.params = params
+        self.batchWindow = params.batchWindow
+        self.uploadFormat = uploadFormats[params.uploadCodec]
+        self.audioQueue.maxLatency = params.maxLatency
+        self.rejector.params = params.rejectionParams
+        if not self.runLocal:
+            openai.api_key = params.apiKey
 
     def main_loop(self):
         while True:
-            wavBytes = None
             try:
                 helper.logger.debug("Recognizer waiting...")
                 audioData = self.audioQueue.get(timeout=10)
-                wavBytes = audioData["audio"]
-                resultQueue = audioData["queue"]
-                endTime = audioData["endTime"]
-                cloneQueue = None
-                if "clonequeue" in audioData:
-                    cloneQueue = audioData["clonequeue"]
             except queue.Empty:
                 continue
             finally:
                 if self.interruptEvent.is_set():
                     helper.logger.debug("Recognizer exiting...")
+                    if self.onlineExecutor is not None:
+                        self.onlineExecutor.shutdown(wait=False, cancel_futures=True)
                     if self.model is not None:
                         del self.model  #This is just to ensure the allocated resources are free'd up correctly.
                         import torch
@@ -62,48 +125,490 @@ class Recognizer:
                         gc.collect()
                     return
 
-            helper.logger.debug("Running recognition...")
-            if self.runLocal:
-                segments, info = self.model.transcribe(io.BytesIO(wavBytes), beam_size=5, vad_filter=True)
-                info:TranscriptionInfo
-                info:dict = dict(info._asdict())
+            if self.onlineExecutor is not None:
+                self.submit_online(audioData)
+                continue
+
+            batch = [audioData]
+            if self.runLocal and self.batchWindow > 0 and "streamID" not in audioData:
+                batch.extend(self.gather_batch(audioData.get("speaker", "default")))
+
+            #Streamed chunks are handled separately, as they need to be decoded together with the rest of their phrase.
+            for item in batch:
+                if "streamID" in item:
+                    self.process_stream_chunk(item)
+            batch = [item for item in batch if "streamID" not in item]
+            if len(batch) == 0:
+                continue
+
+            #If the scheduler flagged anything as running late, it's decoded greedily instead of with the full beam search.
+            #The rest of the batch still gets the full beam, so the late ones are decoded as a group of their own.
+            fullBatch = [item for item in batch if not item.get("fastDecode", False)]
+            fastBatch = [item for item in batch if item.get("fastDecode", False)]
+            for group, beamSize in ((fastBatch, 1), (fullBatch, 5)):
+                if len(group) > 0:
+                    self.recognize_batch(group, beamSize)
+
+    def recognize_batch(self, batch:list, beamSize:int):
+        helper.logger.debug(f"Running recognition on {len(batch)} utterance(s) with beam size {beamSize}...")
+        startTime = time.monotonic()
+        languages = [self.get_sticky_language(item) for item in batch]
+        speechTimestamps = [item.get("speechTimestamps") for item in batch]
+        #Precomputed features can go straight to the encoder, which is what the batched path does.
+        #So do forced languages, since only the batched path still checks what language whisper would've detected.
+        if len(batch) > 1 or "features" in batch[0] or languages[0] is not None:
+            results = self.transcribe_batch([item["audio"] for item in batch], beamSize=beamSize, languages=languages, speechTimestampsList=speechTimestamps,
+                                            featuresList=[item.get("features") for item in batch])
+        else:
+            results = [self.transcribe(batch[0]["audio"], speechTimestamps=speechTimestamps[0], beam_size=beamSize, language=languages[0])]
+        if beamSize == 5:
+            #Only full decodes are used for the estimate, the scheduler accounts for the faster ones itself.
+            self.audioQueue.record_processing_time(sum(item["audio"].shape[0] for item in batch) / helper.whisperSampleRate, time.monotonic() - startTime)
+
+        for item, language, (segments, info) in zip(batch, languages, results):
+            self.update_sticky_language(item, language, segments, info)
+            self.deliver_result(item, segments, info)
+
+    def get_sticky_language(self, audioData:dict) -> Optional[str]:
+        #Returns the language to force for this speaker, or None if it should be detected.
+        if not self.runLocal:
+            return None     #The API doesn't report how confident it is in the language, so there's nothing to go on.
+        languageState = self.speakerLanguages.get(audioData.get("speaker", "default"))
+        if languageState is None or not languageState["locked"]:
+            return None
+        if languageState["sinceCheck"] >= languageRecheckInterval:
+            return None
+        return languageState["language"]
+
+    def update_sticky_language(self, audioData:dict, forcedLanguage:Optional[str], segments, info:dict):
+        if not self.runLocal or info["language"] is None:
+            return
+        speaker = audioData.get("speaker", "default")
+        languageState = self.speakerLanguages.setdefault(speaker, {"language": None, "streak": 0, "locked": False, "sinceCheck": 0})
+
+        if forcedLanguage is not None:
+            #Whisper reports a probability of 1 for forced languages, so use the decoding confidence instead.
+            #Consistently low confidence likely means they switched languages, so go back to detecting it.
+            languageState["sinceCheck"] += 1
+            if len(segments) > 0 and sum(segment.avg_logprob for segment in segments) / len(segments) < -1.0:
+                helper.logger.debug(f"Low confidence with forced language {forcedLanguage} for {speaker}, detecting it again.")
+                languageState.update(streak=0, locked=False)
+            #A forced language that's wrong gets translated into rather than transcribed, which often still decodes confidently.
+            #So the batched path also reports what the detector would've said, and a confident disagreement ends the lock too.
+            elif info.get("detected_language") not in (None, forcedLanguage) and info.get("detected_language_probability", 0) >= languageLockProbability:
+                helper.logger.debug(f"Detected {info['detected_language']} for {speaker} while {forcedLanguage} was forced, detecting it again.")
+                languageState.update(language=info["detected_language"], streak=1, locked=False)
+            return
+
+        languageState["sinceCheck"] = 0
+        if info["language_probability"] >= languageLockProbability and info["language"] == languageState["language"]:
+            languageState["streak"] += 1
+        elif info["language_probability"] >= languageLockProbability:
+            languageState.update(language=info["language"], streak=1, locked=False)
+        else:
+            languageState.update(streak=0, locked=False)
+
+        if not languageState["locked"] and languageState["streak"] >= languageLockCount:
+            helper.logger.debug(f"Locking language for {speaker} to {languageState['language']}.")
+            languageState["locked"] = True
+
+    def reset_session_state(self):
+        #The recognizer outlives sessions, but the next one may well have different speakers speaking different languages.
+        self.speakerLanguages.clear()
+
+    def add_speaker(self, speaker:str, isSpeaking:Callable[[], bool]):
+        self.speakingChecks[speaker] = isSpeaking
+
+    def remove_speaker(self, speaker:str):
+        self.speakingChecks.pop(speaker, None)
+
+    def gather_batch(self, speaker:str) -> list:
+        #Collect whatever else is queued, and whatever arrives within the batching window (usually the other speaker's utterance).
+        #Waiting is only worth it while someone else is actually in the middle of an utterance, otherwise nothing's coming.
+        extraItems = list()
+        batchSpeakers = {speaker}
+        deadline = time.monotonic() + self.batchWindow
+        while len(extraItems) < maxBatchSize - 1:
+            try:
+                extraItems.append(self.audioQueue.get_nowait())
+                batchSpeakers.add(extraItems[-1].get("speaker", "default"))
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not any(isSpeaking() for otherSpeaker, isSpeaking in list(self.speakingChecks.items()) if otherSpeaker not in batchSpeakers):
+                break
+            try:
+                extraItems.append(self.audioQueue.get(timeout=min(remaining, speakingPollInterval)))
+                batchSpeakers.add(extraItems[-1].get("speaker", "default"))
+            except queue.Empty:
+                pass
+        return extraItems
+
+    def submit_online(self, audioData:dict):
+        #Wait for a free slot, so we never have more than maxInFlight requests running.
+        while not self.inFlightSlots.acquire(timeout=1):
+            if self.interruptEvent.is_set():
+                return
+
+        entry = {"audioData": audioData, "result": None, "done": False, "startTime": time.monotonic()}
+        with self.pendingLock:
+            pending = self.pendingResults.setdefault(audioData["queue"], list())
+            pending.append(entry)
+            pending.sort(key=lambda pendingEntry: pendingEntry["audioData"]["endTime"])
+
+        helper.logger.debug(f"Sending utterance to OpenAI ({len(pending)} pending for this speaker)...")
+        future = self.onlineExecutor.submit(self.transcribe, audioData["audio"], audioData.get("speechTimestamps"))
+        future.add_done_callback(lambda finishedFuture: self.online_request_done(entry, finishedFuture))
+
+    def online_request_done(self, entry:dict, future:concurrent.futures.Future):
+        self.inFlightSlots.release()
+        if future.cancelled():
+            return
+        try:
+            entry["result"] = future.result()
+            self.audioQueue.record_processing_time(entry["audioData"]["audio"].shape[0] / helper.whisperSampleRate, time.monotonic() - entry["startTime"])
+        except Exception as e:
+            helper.logger.error(f"Online recognition failed: {e}")
+
+        #Deliver every finished result at the front of this speaker's queue, so the order they were spoken in is kept.
+        with self.pendingLock:
+            entry["done"] = True
+            pending = self.pendingResults[entry["audioData"]["queue"]]
+            while len(pending) > 0 and pending[0]["done"]:
+                finishedEntry = pending.pop(0)
+                if finishedEntry["result"] is not None:
+                    segments, info = finishedEntry["result"]
+                    self.deliver_result(finishedEntry["audioData"], segments, info)
+
+    def transcribe(self, audio:np.ndarray, speechTimestamps:Optional[list]=None, **kwargs) -> tuple:
+        #audio is float32 mono at whisper's sample rate, which faster-whisper can use as-is.
+        #If the detector's speech spans are given, only those get transcribed and the VAD doesn't run a second time.
+        duration = audio.shape[0] / helper.whisperSampleRate
+        if speechTimestamps is not None:
+            if len(speechTimestamps) == 0:
+                return [], {"language": None, "language_probability": 0, "duration": duration}
+            audio = collect_chunks(audio, speechTimestamps)
+
+        if self.runLocal:
+            kwargs.setdefault("beam_size", 5)
+            kwargs.setdefault("vad_filter", speechTimestamps is None)
+            segments, info = self.model.transcribe(audio, **kwargs)
+            if speechTimestamps is not None:
+                segments = restore_speech_timestamps(segments, speechTimestamps, helper.whisperSampleRate)
+            segments = list(segments)
+            info:TranscriptionInfo
+            info:dict = dict(info._asdict())
+        else:
+            uploadFile = self.encode_upload(audio)
+            helper.logger.debug(f"Uploading {uploadFile.getbuffer().nbytes} bytes of {self.uploadFormat[1]} audio.")
+            info:dict = openai.Audio.transcribe("whisper-1", uploadFile, response_format="verbose_json")
+            segments = info["segments"]
+        info["duration"] = duration     #The full utterance, not just the speech in it.
+        return segments, info
+
+    def transcribe_partial(self, audio:np.ndarray, speaker:str="default") -> str:
+        #Quick greedy decode for the detector's endpointer, which only cares about how the utterance ends.
+        segments, _ = self.model.transcribe(audio[-partialTranscriptDuration * helper.whisperSampleRate:], beam_size=1, without_timestamps=True,
+                                            condition_on_previous_text=False, language=self.get_sticky_language({"speaker": speaker}))
+        return " ".join(segment.text.strip() for segment in segments)
+
+    def encode_upload(self, audio:np.ndarray) -> io.BytesIO:
+        #Compresses the audio in memory. The openai library needs the file name to work out the format.
+        containerFormat, codec, bitrate = self.uploadFormat
+        uploadFile = io.BytesIO()
+        uploadFile.name = f"audio.{containerFormat}"
+        frame = av.AudioFrame.from_ndarray(np.frombuffer(helper.float32_to_pcm(audio), dtype=np.int16)[np.newaxis, :], format="s16", layout="mono")
+        frame.sample_rate = helper.whisperSampleRate
+        with av.open(uploadFile, mode="w", format=containerFormat) as container:
+            stream = container.add_stream(codec, rate=helper.whisperSampleRate, layout="mono")
+            if bitrate is not None:
+                stream.bit_rate = bitrate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        uploadFile.seek(0)
+        return uploadFile
+
+    def transcribe_batch(self, audioList:list, beamSize:int=5, languages:Optional[list]=None, speechTimestampsList:Optional[list]=None,
+                         featuresList:Optional[list]=None) -> list:
+        #Runs VAD and feature extraction per utterance (unless the detector already did), then a single encoder pass,
+        #language detection and decoder pass for the whole batch.
+        #Anything that doesn't fit in a single 30s window (or fails the usual quality checks) falls back to the regular transcribe().
+        featureExtractor = self.model.feature_extractor
+        samplingRate = featureExtractor.sampling_rate
+        results = [None] * len(audioList)
+        if languages is None:
+            languages = [None] * len(audioList)
+        if speechTimestampsList is None:
+            speechTimestampsList = [None] * len(audioList)
+        if featuresList is None:
+            featuresList = [None] * len(audioList)
+        batchIndexes = list()
+        batchFeatures = list()
+        durations = list()
+
+        for index, originalAudio in enumerate(audioList):
+            durations.append(originalAudio.shape[0] / samplingRate)
+            if speechTimestampsList[index] is None:
+                speechTimestampsList[index] = get_speech_timestamps(originalAudio)
+            audio = collect_chunks(originalAudio, speechTimestampsList[index])
+            if audio.shape[0] == 0:
+                results[index] = ([], {"language": None, "language_probability": 0, "duration": durations[index]})
+            elif audio.shape[0] > featureExtractor.n_samples:
+                results[index] = self.transcribe(originalAudio, speechTimestamps=speechTimestampsList[index], beam_size=beamSize, language=languages[index])
             else:
-                with open("temp.wav","wb+") as fp:
-                    fp.write(wavBytes)
-                    fp.seek(0)
-                    info:dict = openai.Audio.transcribe("whisper-1", fp, response_format="verbose_json")
-                    segments = info["segments"]
-                os.remove("temp.wav")
-            duration = datetime.timedelta(seconds=info["duration"])
-            audioLanguage = info["language"]
-            recognizedText = ""
-            for segment in segments:
-                if segment.no_speech_prob < 0.70:
-                    recognizedText += " " + segment.text.strip()
+                batchIndexes.append(index)
+                if featuresList[index] is not None:
+                    batchFeatures.append(featuresList[index])
                 else:
-                    helper.logger.warning(f"Skipping segment {segment.text} with {segment.no_speech_prob*100}% chance of being non-speech")
-            recognizedText = recognizedText.strip()
-
-            hallucinated = False
-
-            if recognizedText == "" or recognizedText == ".":
-                hallucinated = True
-            hallucinations = ["thank you for watching", "thanks for watching", "thank you so much for watching", "Please subscribe to the channel", "."]
-            for hallucination in hallucinations:
-                if hallucination.lower() in recognizedText.lower():
-                    if len(recognizedText) < len(hallucination)+5:
-                        hallucinated = True
-            if hallucinated:
-                helper.logger.warning("Hallucinating, ignoring it...")
+                    batchFeatures.append(featureExtractor(audio)[:, :featureExtractor.nb_max_frames])
+
+        if len(batchFeatures) == 0:
+            return results
+
+        encoderOutput = self.model.model.encode(get_ctranslate2_storage(np.stack(batchFeatures)))
+
+        knownLanguages = [languages[index] for index in batchIndexes]
+        detectedResults = [(None, 0)] * len(batchFeatures)
+        if not self.model.model.is_multilingual:
+            languageResults = [("en", 1)] * len(batchFeatures)
+        else:
+            #Detection is a single decoder step on the encoder output we already have, so it runs even for forced languages,
+            #which lets update_sticky_language notice when the forced one is wrong.
+            detectedResults = [(languageProbs[0][0][2:-2], languageProbs[0][1]) for languageProbs in self.model.model.detect_language(encoderOutput)]
+            languageResults = [detectedResult if knownLanguage is None else (knownLanguage, 1) for detectedResult, knownLanguage in zip(detectedResults, knownLanguages)]
+
+        tokenizers = [Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual, task="transcribe", language=language) for language, _ in languageResults]
+        prompts = [self.model.get_prompt(tokenizer, [], without_timestamps=True) for tokenizer in tokenizers]
+
+        generationResults = self.model.model.generate(
+            encoderOutput,
+            prompts,
+            beam_size=beamSize,
+            patience=1,
+            length_penalty=1,
+            max_length=self.model.max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=[-1]
+        )
+
+        for batchIndex, index in enumerate(batchIndexes):
+            result = generationResults[batchIndex]
+            tokenizer = tokenizers[batchIndex]
+            language, languageProbability = languageResults[batchIndex]
+            tokens = result.sequences_ids[0]
+            avgLogprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            text = tokenizer.decode(tokens)
+            compressionRatio = get_compression_ratio(text.strip())
+
+            if compressionRatio > 2.4 or avgLogprob < -1.0:
+                #Would've needed a temperature fallback, let transcribe() handle it.
+                helper.logger.debug(f"Batched decode of item {index} failed the quality checks, retrying it on its own.")
+                results[index] = self.transcribe(audioList[index], speechTimestamps=speechTimestampsList[index], beam_size=beamSize, language=languages[index])
                 continue
 
-            helper.logger.debug(f"recognizedText: {recognizedText}")
+            segment = Segment(id=1, seek=0, start=0.0, end=durations[index], text=text, tokens=tokens, temperature=0.0,
+                              avg_logprob=avgLogprob, compression_ratio=compressionRatio, no_speech_prob=result.no_speech_prob, words=None)
+            results[index] = ([segment], {"language": language, "language_probability": languageProbability, "duration": durations[index],
+                                          "detected_language": detectedResults[batchIndex][0], "detected_language_probability": detectedResults[batchIndex][1]})
+
+        return results
+
+    def process_stream_chunk(self, audioData:dict):
+        #Re-decodes the rolling window of a phrase that's still being spoken, and commits the words that two consecutive
+        #hypotheses agree on (LocalAgreement-2). The window is then trimmed to start right after the last committed word.
+        streamID = audioData["streamID"]
+        isFinal = audioData["final"]
+        chunk:np.ndarray = audioData["audio"]
+        if audioData.get("discard", False):
+            self.streams.pop(streamID, None)    #The detector decided the phrase was an echo after sending part of it.
+            return
+
+        if streamID not in self.streams:
+            self.streams[streamID] = {
+                "audio": np.zeros(0, dtype=np.float32),
+                "offset": 0.0,
+                "previousWords": list(),
+                "startTime": audioData["endTime"] - datetime.timedelta(seconds=chunk.shape[0] / 16000),
+                "committedAnything": False
+            }
+        state = self.streams[streamID]
+        state["audio"] = np.concatenate([state["audio"], chunk])
+        windowDuration = state["audio"].shape[0] / 16000
+
+        words = list()
+        language = None
+        if windowDuration > 0:
+            #Chunks are only sent while the detector hears speech, so there's nothing for the VAD to remove.
+            forcedLanguage = self.get_sticky_language(audioData)
+            segments, info = self.transcribe(state["audio"], vad_filter=False, word_timestamps=True, condition_on_previous_text=False, language=forcedLanguage)
+            language = info["language"]
+            for segment in segments:
+                #The window gets decoded again on every chunk, so these aren't counted as rejections. Only the committed text is.
+                if self.rejector.check_segment(segment) is None and segment.words is not None:
+                    words.extend((state["offset"] + word.start, state["offset"] + word.end, word.word) for word in segment.words)
+
+        if isFinal:
+            committedWords = words
+        else:
+            def normalize(word:str) -> str:
+                return "".join(char for char in word.lower() if char.isalnum())
+
+            agreedCount = 0
+            for newWord, previousWord in zip(words, state["previousWords"]):
+                if normalize(newWord[2]) != normalize(previousWord[2]):
+                    break
+                agreedCount += 1
+            if agreedCount == 0 and windowDuration > maxStreamWindow:
+                agreedCount = max(len(words) - 2, 0)
+            committedWords = words[:agreedCount]
+            state["previousWords"] = words[agreedCount:]
 
-            resultQueue.put({
-                    "text":recognizedText,
-                    "lang":audioLanguage,
-                    "startTime": endTime-duration,
-                    "endTime": endTime
+        if len(committedWords) > 0:
+            committedEnd = committedWords[-1][1]
+            state["audio"] = state["audio"][max(int((committedEnd - state["offset"]) * 16000), 0):]
+            state["offset"] = committedEnd
+
+            recognizedText = "".join(word[2] for word in committedWords).strip()
+            if self.rejector.accept_text(recognizedText):
+                helper.logger.debug(f"Committed streamed text: {recognizedText}")
+                state["committedAnything"] = True
+                #Only decodes that commit something count towards the language lock. The rest get decoded again with the next chunk anyway.
+                self.update_sticky_language(audioData, forcedLanguage, segments, info)
+                audioData["queue"].put({
+                    "text": recognizedText,
+                    "lang": language,
+                    "startTime": state["startTime"] + datetime.timedelta(seconds=committedWords[0][0]),
+                    "endTime": state["startTime"] + datetime.timedelta(seconds=committedEnd),
+                    "partial": not isFinal,
+                    "continuationID": audioData.get("continuationID")
                 })
-            if cloneQueue is not None:
-                cloneQueue.put(wavBytes)
\ No newline at end of file
+
+        if isFinal:
+            self.streams.pop(streamID)
+            if "clonequeue" in audioData and "cloneaudio" in audioData and state["committedAnything"]:
+                audioData["clonequeue"].put(audioData["cloneaudio"])
+
+    def deliver_result(self, audioData:dict, segments, info:dict):
+        audio = audioData["audio"]
+        resultQueue = audioData["queue"]
+        endTime = audioData["endTime"]
+        cloneQueue = None
+        if "clonequeue" in audioData:
+            cloneQueue = audioData["clonequeue"]
+
+        duration = datetime.timedelta(seconds=info["duration"])
+        audioLanguage = info["language"]
+        #Anything rejected here never reaches the translator or the cloner.
+        recognizedText = " ".join(segment.text.strip() for segment in self.rejector.filter_segments(segments)).strip()
+        if not self.rejector.accept_text(recognizedText):
+            return
+
+        helper.logger.debug(f"recognizedText: {recognizedText}")
+
+        resultQueue.put({
+                "text":recognizedText,
+                "lang":audioLanguage,
+                "startTime": endTime-duration,
+                "endTime": endTime,
+                "continuationID": audioData.get("continuationID")
+            })
+        if cloneQueue is not None:
+            cloneQueue.put(audio)   #Same buffer the recognizer used, no copy.
+
+
+class RecognizerService:
+    #Keeps a single recognizer (and its model) alive across interpretation sessions.
+    #Every interpreter acquires it on start and releases it on stop, and it's only torn down when the model settings change,
+    #the idle timeout runs out, or the app exits.
+    lock = threading.Lock()
+    recognizer:Optional[Recognizer] = None
+    recognizerThread:Optional[threading.Thread] = None
+    refCount = 0
+    idleTimer:Optional[threading.Timer] = None
+
+    @staticmethod
+    def acquire(params:RecognizerParams) -> Recognizer:
+        with RecognizerService.lock:
+            if RecognizerService.idleTimer is not None:
+                RecognizerService.idleTimer.cancel()
+                RecognizerService.idleTimer = None
+
+            recognizer = RecognizerService.recognizer
+            #Never rebuild it from under a session that's still using it.
+            if recognizer is not None and RecognizerService.refCount == 0 and recognizer.needs_rebuild(params):
+                helper.logger.info("Recognizer settings changed, rebuilding it.")
+                RecognizerService._stop_recognizer()
+                recognizer = None
+
+            if recognizer is None:
+                recognizer = Recognizer(params)
+                RecognizerService.recognizer = recognizer
+                RecognizerService.recognizerThread = threading.Thread(target=recognizer.main_loop)
+                RecognizerService.recognizerThread.start()
+            else:
+                helper.logger.debug("Reusing the already loaded recognizer.")
+                recognizer.update_params(params)
+            recognizer.reset_session_state()
+
+            RecognizerService.refCount += 1
+            return recognizer
+
+    @staticmethod
+    def release():
+        with RecognizerService.lock:
+            RecognizerService.refCount = max(RecognizerService.refCount - 1, 0)
+            if RecognizerService.recognizer is not None:
+                RecognizerService.recognizer.reset_session_state()
+            if RecognizerService.refCount > 0 or RecognizerService.recognizer is None:
+                return
+
+            idleTimeout = RecognizerService.recognizer.params.idleTimeout
+            if idleTimeout > 0:
+                helper.logger.debug(f"Recognizer unused, unloading it in {idleTimeout} seconds.")
+                RecognizerService.idleTimer = threading.Timer(idleTimeout, RecognizerService._idle_unload)
+                RecognizerService.idleTimer.daemon = True
+                RecognizerService.idleTimer.start()
+
+    @staticmethod
+    def shutdown():
+        #Called on app exit.
+        with RecognizerService.lock:
+            if RecognizerService.idleTimer is not None:
+                RecognizerService.idleTimer.cancel()
+                RecognizerService.idleTimer = None
+            RecognizerService._stop_recognizer()
+
+    @staticmethod
+    def unload_if_idle() -> bool:
+        #Frees the loaded model for something else that needs the memory (the benchmark). Returns False if a session is using it.
+        with RecognizerService.lock:
+            if RecognizerService.refCount > 0:
+                return False
+            if RecognizerService.idleTimer is not None:
+                RecognizerService.idleTimer.cancel()
+                RecognizerService.idleTimer = None
+            RecognizerService._stop_recognizer()
+            return True
+
+    @staticmethod
+    def _idle_unload():
+        with RecognizerService.lock:
+            if RecognizerService.refCount == 0:
+                helper.logger.debug("Recognizer idle timeout reached, unloading it.")
+                RecognizerService._stop_recognizer()
+
+    @staticmethod
+    def _stop_recognizer():
+        #Must be called while holding the lock.
+        if RecognizerService.recognizer is None:
+            return
+        RecognizerService.recognizer.interruptEvent.set()
+        if RecognizerService.recognizerThread is not None and RecognizerService.recognizerThread.is_alive():
+            RecognizerService.recognizerThread.join()
+        RecognizerService.recognizer = None
+        RecognizerService.recognizerThread = None
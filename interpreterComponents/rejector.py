@@ -0,0 +1,87 @@
+import collections
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from utils import helper
+
+hallucinations = ["thank you for watching", "thanks for watching", "thank you so much for watching", "Please subscribe to the channel", "."]
+
+@dataclass
+class RejectionParams:
+    maxNoSpeechProb: float = 0.7        #Whisper's own estimate that the segment is silence/noise.
+    minAvgLogprob: float = -1.0         #Average token log probability, low values mean whisper is guessing.
+    maxCompressionRatio: float = 2.4    #High values mean the text is very repetitive (a typical hallucination loop).
+    minDuration: float = 0.2            #In seconds. Shorter segments are almost always noise bursts.
+    maxRepetition: float = 0.7          #Fraction of repeated words, only checked on segments with at least minRepetitionWords words.
+    minRepetitionWords: int = 6
+
+    def __post_init__(self):
+        for fieldName in ["maxNoSpeechProb", "minAvgLogprob", "maxCompressionRatio", "minDuration", "maxRepetition"]:
+            setattr(self, fieldName, float(getattr(self, fieldName)))
+        self.minRepetitionWords = int(self.minRepetitionWords)
+
+class Rejector:
+    #Decides which recognized segments are actually speech, before they're sent off to be translated, synthesized and cloned.
+    #Works on both faster-whisper Segments and the segments returned by the API, as both support attribute access.
+    def __init__(self, params:RejectionParams):
+        self.params = params
+        self.rejectionCounts = collections.Counter()
+        self.acceptedCount = 0
+        self.countLock = threading.Lock()
+
+    def check_segment(self, segment) -> Optional[str]:
+        #Returns the reason the segment should be rejected, or None if it's fine.
+        params = self.params
+        if segment.no_speech_prob >= params.maxNoSpeechProb:
+            return "no_speech_prob"
+        if segment.avg_logprob < params.minAvgLogprob:
+            return "avg_logprob"
+        if segment.compression_ratio > params.maxCompressionRatio:
+            return "compression_ratio"
+        if segment.end - segment.start < params.minDuration:
+            return "duration"
+
+        words = ["".join(char for char in word if char.isalnum()) for word in segment.text.lower().split()]
+        if len(words) >= params.minRepetitionWords and 1 - len(set(words)) / len(words) > params.maxRepetition:
+            return "repetition"
+        return None
+
+    @staticmethod
+    def check_text(recognizedText:str) -> Optional[str]:
+        if recognizedText == "" or recognizedText == ".":
+            return "empty"
+        for hallucination in hallucinations:
+            if hallucination.lower() in recognizedText.lower():
+                if len(recognizedText) < len(hallucination)+5:
+                    return "hallucination"
+        return None
+
+    def filter_segments(self, segments) -> list:
+        acceptedSegments = list()
+        for segment in segments:
+            reason = self.check_segment(segment)
+            if reason is None:
+                acceptedSegments.append(segment)
+            else:
+                self.count_rejection(reason, segment.text)
+        return acceptedSegments
+
+    def accept_text(self, recognizedText:str) -> bool:
+        reason = self.check_text(recognizedText)
+        if reason is not None:
+            self.count_rejection(reason, recognizedText)
+            return False
+        with self.countLock:
+            self.acceptedCount += 1
+        return True
+
+    def count_rejection(self, reason:str, text:str):
+        with self.countLock:
+            self.rejectionCounts[reason] += 1
+            totals = ", ".join(f"{countedReason}={count}" for countedReason, count in self.rejectionCounts.items())
+            helper.logger.warning(f"Rejected \"{text.strip()}\" ({reason}). Rejections so far: {totals}, {self.acceptedCount} accepted.")
+
+    def get_stats(self) -> dict:
+        with self.countLock:
+            return {"accepted": self.acceptedCount, "rejected": dict(self.rejectionCounts)}
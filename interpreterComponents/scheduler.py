@@ -0,0 +1,145 @@
+import collections
+import datetime
+import queue
+import threading
+import time
+
+from utils import helper
+
+#How often (in seconds) the scheduler logs its counters.
+statsInterval = 60
+#Decoding with beam_size=1 is assumed to take roughly this fraction of the time of a full decode.
+fastDecodeFactor = 0.5
+
+class RecognitionScheduler:
+    #Sits in front of the recognizer in place of a plain queue.Queue (it supports the same put_nowait/get calls).
+    #Every speaker gets its own FIFO, and the speakers share the recognizer using weighted fair queuing, based on how many
+    #seconds of audio each one has had transcribed. Items that can't be transcribed before their deadline
+    #(endTime + maxLatency) are downgraded to a faster decode, or dropped entirely if even that would be too late.
+    def __init__(self, maxLatency:float=0.0):
+        self.maxLatency = maxLatency    #0 disables the deadlines.
+        self.speakerQueues = collections.OrderedDict()
+        self.virtualTimes = dict()
+        self.weights = dict()
+        self.stats = dict()
+        self.realTimeFactor = None      #Running estimate of processing time / audio duration.
+        self.condition = threading.Condition()
+        self.lastStatsTime = time.monotonic()
+
+    def put(self, audioData:dict, block=True, timeout=None):
+        self.put_nowait(audioData)
+
+    def put_nowait(self, audioData:dict):
+        speaker = audioData.get("speaker", "default")
+        with self.condition:
+            if speaker not in self.speakerQueues:
+                self.speakerQueues[speaker] = collections.deque()
+                self.virtualTimes[speaker] = 0.0
+                self.stats[speaker] = {"scheduled": 0, "downgraded": 0, "dropped": 0, "totalWait": 0.0}
+            self.weights[speaker] = max(float(audioData.get("weight", 1.0)), 0.01)
+
+            if len(self.speakerQueues[speaker]) == 0:
+                #A speaker that was idle doesn't get to bank the time it wasn't using.
+                activeTimes = [self.virtualTimes[otherSpeaker] for otherSpeaker, otherQueue in self.speakerQueues.items() if len(otherQueue) > 0]
+                if len(activeTimes) > 0:
+                    self.virtualTimes[speaker] = max(self.virtualTimes[speaker], min(activeTimes))
+
+            self.speakerQueues[speaker].append(audioData)
+            self.condition.notify()
+
+    def get(self, block=True, timeout=None) -> dict:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                audioData = self._pop_next()
+                if audioData is not None:
+                    return audioData
+
+                if not block:
+                    raise queue.Empty
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self.condition.wait(remaining)
+
+    def get_nowait(self) -> dict:
+        return self.get(block=False)
+
+    def qsize(self) -> int:
+        with self.condition:
+            return sum(len(speakerQueue) for speakerQueue in self.speakerQueues.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def record_processing_time(self, audioDuration:float, processingTime:float):
+        #Called by the recognizer after every decode, so the deadline checks are based on how fast it actually is.
+        if audioDuration <= 0:
+            return
+        with self.condition:
+            currentFactor = processingTime / audioDuration
+            if self.realTimeFactor is None:
+                self.realTimeFactor = currentFactor
+            else:
+                self.realTimeFactor = 0.8 * self.realTimeFactor + 0.2 * currentFactor
+
+    def get_stats(self) -> dict:
+        with self.condition:
+            return {speaker: dict(speakerStats, queued=len(self.speakerQueues[speaker])) for speaker, speakerStats in self.stats.items()}
+
+    def _pop_next(self):
+        while True:
+            backlogged = [speaker for speaker, speakerQueue in self.speakerQueues.items() if len(speakerQueue) > 0]
+            if len(backlogged) == 0:
+                self._log_stats()
+                return None
+
+            speaker = min(backlogged, key=lambda backloggedSpeaker: self.virtualTimes[backloggedSpeaker])
+            audioData = self.speakerQueues[speaker].popleft()
+            speakerStats = self.stats[speaker]
+            audioDuration = self._get_duration(audioData)
+            waitTime = (datetime.datetime.now() - audioData["endTime"]).total_seconds()
+
+            if not self._check_deadline(audioData, audioDuration, waitTime):
+                speakerStats["dropped"] += 1
+                helper.logger.warning(f"Dropping {audioDuration:.1f}s utterance from {speaker}, it's been waiting {waitTime:.1f}s and would finish past its deadline.")
+                continue
+
+            self.virtualTimes[speaker] += audioDuration / self.weights[speaker]
+            speakerStats["scheduled"] += 1
+            speakerStats["totalWait"] += waitTime
+            if audioData.get("fastDecode", False):
+                speakerStats["downgraded"] += 1
+            helper.logger.debug(f"Scheduling {audioDuration:.1f}s utterance from {speaker} (waited {waitTime:.1f}s, "
+                                f"backlog: {', '.join(f'{otherSpeaker}={len(otherQueue)}' for otherSpeaker, otherQueue in self.speakerQueues.items())}).")
+            self._log_stats()
+            return audioData
+
+    def _check_deadline(self, audioData:dict, audioDuration:float, waitTime:float) -> bool:
+        #Returns False if the item should be dropped. Marks it with fastDecode if it needs to be downgraded.
+        if self.maxLatency <= 0 or self.realTimeFactor is None:
+            return True
+        if "streamID" in audioData:
+            return True     #Streamed chunks are part of a phrase that's still being decoded, they can't be skipped.
+
+        timeLeft = self.maxLatency - waitTime
+        expectedTime = audioDuration * self.realTimeFactor
+        if expectedTime <= timeLeft:
+            return True
+        if expectedTime * fastDecodeFactor <= timeLeft:
+            audioData["fastDecode"] = True
+            return True
+        return False
+
+    def _log_stats(self):
+        if time.monotonic() - self.lastStatsTime < statsInterval:
+            return
+        self.lastStatsTime = time.monotonic()
+        for speaker, speakerStats in self.stats.items():
+            averageWait = speakerStats["totalWait"] / max(speakerStats["scheduled"], 1)
+            helper.logger.info(f"Recognition scheduler stats for {speaker}: {speakerStats['scheduled']} scheduled, {speakerStats['downgraded']} downgraded, "
+                               f"{speakerStats['dropped']} dropped, {averageWait:.2f}s average wait, {len(self.speakerQueues[speaker])} queued.")
+
+    @staticmethod
+    def _get_duration(audioData:dict) -> float:
+        return audioData["audio"].shape[0] / helper.whisperSampleRate
@@ -2,9 +2,12 @@ import logging
 import queue
 import threading
 from dataclasses import dataclass
+from typing import Optional
 
+import sounddevice
 from elevenlabslib import GenerationOptions, PlaybackOptions, ElevenLabsModel
 
+from interpreterComponents.echoSuppressor import playbackReference
 from utils import helper
 
 @dataclass
@@ -13,6 +16,7 @@ class SynthesizerParams:
     outputDeviceName: str
     voiceID: str
     modelID: str
+    loopbackDeviceName: Optional[str] = None    #The other end of the output cable, recorded so the detectors can recognize our own playback.
 class Synthesizer:
     def __init__(self, params:SynthesizerParams, ttsQueue:queue.Queue):
         self.eventQueue = queue.Queue()
@@ -37,6 +41,7 @@ class Synthesizer:
 
 
         self.outputDeviceInfo = helper.get_portaudio_device_info_from_name(params.outputDeviceName, "output")
+        self.loopbackDeviceName = params.loopbackDeviceName
         self.ttsQueue = ttsQueue
         #Let's go with some fairly conservative settings. There will be little emotion.
         #Can't really risk going lower given the clones may be low quality.
@@ -50,6 +55,14 @@ class Synthesizer:
 
     def main_loop(self):
         threading.Thread(target=self.waitForPlaybackReady).start()  # Starts the thread that handles playback ordering.
+        tapStarted = False
+        if self.loopbackDeviceName is not None:
+            #Echo suppression is nice to have, it's not worth losing the voice over.
+            try:
+                playbackReference.start_tap(self.loopbackDeviceName)
+                tapStarted = True
+            except (RuntimeError, sounddevice.PortAudioError) as e:
+                helper.logger.warning(f"Couldn't capture the playback from {self.loopbackDeviceName}, continuing without echo suppression: {e}")
         while True:
             try:
                 prompt = self.ttsQueue.get(timeout=10)
@@ -58,6 +71,8 @@ class Synthesizer:
             finally:
                 if self.interruptEvent.is_set():
                     helper.logger.debug("Synthetizer main loop exiting...")
+                    if tapStarted:
+                        playbackReference.stop_tap(self.loopbackDeviceName)
                     return
 
             if self.isRunning.is_set():
@@ -0,0 +1,133 @@
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+
+from utils import helper
+
+#Conversations repeat a lot ("yes", "can you hear me?", names...), so translations are remembered across runs.
+translationMemoryPath = os.path.join(helper.cacheDir, "translation_memory.sqlite3")
+maxMemoryEntries = 2000         #Kept in the in-memory LRU.
+maxStoredEntries = 50000        #Kept on disk, the least recently used ones go first.
+maxCachedLength = 200           #Long sentences are basically never repeated word for word, so they're not worth storing.
+statsLogInterval = 25           #Log the hit rate every this many lookups.
+
+class TranslationMemory:
+    #Translations keyed by (normalized text, source language, target language, provider).
+    #An LRU dict sits in front of a sqlite database, and it's shared by both translators.
+    def __init__(self, path:str=translationMemoryPath):
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.touched = dict()   #key: lastUsed for hits that haven't been written to disk yet, so a hit never waits on sqlite.
+        self.connection = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS translations (sourceText TEXT, sourceLang TEXT, targetLang TEXT, provider TEXT, "
+                                    "translation TEXT, lastUsed REAL, PRIMARY KEY (sourceText, sourceLang, targetLang, provider))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS lastUsedIndex ON translations (lastUsed)")
+            self.connection.commit()
+            self.storedCount = self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        except sqlite3.Error as e:
+            helper.logger.warning(f"Couldn't open the translation memory, it won't persist between runs: {e}")
+            self.connection = None
+            self.storedCount = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.savedCharacters = 0
+        self.savedTime = 0.0
+        self.missTime = 0.0     #Total time spent on actual translations, to estimate what the hits saved.
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text:str) -> str:
+        #Case and spacing differences don't change the translation. Punctuation does ("yes." vs "yes?"), so it's kept.
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip().casefold()
+
+    def get(self, text:str, sourceLang:str, targetLang:str, provider:str) -> Optional[str]:
+        key = (self.normalize(text), sourceLang.lower(), targetLang.lower(), provider)
+        with self.lock:
+            self.lookups += 1
+            translation = self.entries.get(key)
+            if translation is not None:
+                self.entries.move_to_end(key)
+            elif self.connection is not None:
+                row = self.connection.execute("SELECT translation FROM translations WHERE sourceText=? AND sourceLang=? AND targetLang=? AND provider=?", key).fetchone()
+                if row is not None:
+                    translation = row[0]
+                    self.remember(key, translation)
+            if translation is not None:
+                self.hits += 1
+                self.savedCharacters += len(text)
+                if self.misses > 0:
+                    self.savedTime += self.missTime / self.misses
+                self.touched[key] = time.time()
+            if self.lookups % statsLogInterval == 0:
+                self.log_stats()
+                self.flush_touched()
+        return translation
+
+    def put(self, text:str, sourceLang:str, targetLang:str, provider:str, translation:str, elapsedTime:float):
+        #elapsedTime is how long the provider took, which is what a future hit on this entry saves.
+        key = (self.normalize(text), sourceLang.lower(), targetLang.lower(), provider)
+        with self.lock:
+            self.misses += 1
+            self.missTime += elapsedTime
+            if len(key[0]) > maxCachedLength or key[0] == "":
+                return
+            self.remember(key, translation)
+            if self.connection is None:
+                return
+            try:
+                self.flush_touched(commit=False)
+                cursor = self.connection.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)", key + (translation, time.time()))
+                self.storedCount += cursor.rowcount     #Replacing an existing entry counts too, so it's only an upper bound.
+                if self.storedCount > maxStoredEntries:
+                    self.storedCount = self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                if self.storedCount > maxStoredEntries:
+                    #Evict a tenth at a time, so it doesn't have to happen on every insert.
+                    evictCount = self.storedCount - maxStoredEntries * 9 // 10
+                    self.connection.execute("DELETE FROM translations WHERE rowid IN (SELECT rowid FROM translations ORDER BY lastUsed LIMIT ?)", (evictCount,))
+                    self.storedCount = self.connection.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+                    helper.logger.debug(f"Evicted {evictCount} old entries from the translation memory.")
+                self.connection.commit()
+            except sqlite3.Error as e:
+                helper.logger.warning(f"Couldn't store a translation in the translation memory: {e}")
+
+    def flush_touched(self, commit:bool=True):
+        #Writes out when the recent hits were used, so eviction keeps them around. Must be called with the lock held.
+        if self.connection is None or len(self.touched) == 0:
+            return
+        try:
+            self.connection.executemany("UPDATE translations SET lastUsed=? WHERE sourceText=? AND sourceLang=? AND targetLang=? AND provider=?",
+                                        [(lastUsed,) + key for key, lastUsed in self.touched.items()])
+            if commit:
+                self.connection.commit()
+        except sqlite3.Error as e:
+            helper.logger.warning(f"Couldn't update the translation memory: {e}")
+        self.touched.clear()
+
+    def remember(self, key:tuple, translation:str):
+        self.entries[key] = translation
+        self.entries.move_to_end(key)
+        if len(self.entries) > maxMemoryEntries:
+            self.entries.popitem(last=False)
+
+    def log_stats(self):
+        helper.logger.info(f"Translation memory: {self.hits}/{self.lookups} hits ({self.hits / max(self.lookups, 1):.0%}), "
+                           f"saved {self.savedCharacters} characters and roughly {self.savedTime:.1f}s of translation time.")
+
+translationMemory:Optional[TranslationMemory] = None
+translationMemoryLock = threading.Lock()
+
+def get_translation_memory() -> TranslationMemory:
+    global translationMemory
+    with translationMemoryLock:
+        if translationMemory is None:
+            translationMemory = TranslationMemory()
+        return translationMemory
@@ -0,0 +1,167 @@
+import concurrent.futures
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import deepl
+
+from interpreterComponents.providerSelector import ProviderSelector
+from utils import helper
+
+#How long to wait for other requests to show up before sending a batch off.
+batchWindow = 0.01
+#DeepL accepts at most 50 texts per request.
+maxDeepLBatch = 50
+#Batches for different language pairs/providers are sent at the same time.
+maxConcurrentBatches = 4
+
+@dataclass
+class TranslationRequest:
+    text: str
+    provider: str                   #"deepl" or "google"
+    sourceLang: str                 #In the format the provider expects.
+    targetLang: str
+    languagePair: str               #What the provider stats are tracked under.
+    deeplAPIKey: Optional[str] = None
+    future: concurrent.futures.Future = field(default_factory=concurrent.futures.Future)
+    submitTime: float = 0.0
+
+class TranslationService:
+    #A single translation worker shared by every interpreter, so both directions go through the same clients (and connections).
+    #Requests that arrive within batchWindow of each other and share a provider and language pair go out as a single call.
+    lock = threading.Lock()
+    service:Optional["TranslationService"] = None
+    refCount = 0
+
+    def __init__(self):
+        self.requestQueue = queue.Queue()
+        self.interruptEvent = threading.Event()
+        self.stopLock = threading.Lock()    #So nothing gets queued after the main loop has drained the queue on its way out.
+        self.googleTranslator = helper.translator     #Shared with the UI translations, so they all use the same connections.
+        self.deepLTranslators = dict()      #apiKey: deepl.Translator
+        self.deepLLock = threading.Lock()
+        self.providerSelector = ProviderSelector()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=maxConcurrentBatches, thread_name_prefix="TranslationBatch")
+        self.thread = threading.Thread(target=self.main_loop)
+        self.thread.start()
+
+    @staticmethod
+    def acquire() -> "TranslationService":
+        with TranslationService.lock:
+            if TranslationService.service is None:
+                TranslationService.service = TranslationService()
+            TranslationService.refCount += 1
+            return TranslationService.service
+
+    @staticmethod
+    def release():
+        with TranslationService.lock:
+            TranslationService.refCount = max(TranslationService.refCount - 1, 0)
+            if TranslationService.refCount > 0 or TranslationService.service is None:
+                return
+            TranslationService.service.stop()
+            TranslationService.service = None
+
+    def stop(self):
+        with self.stopLock:
+            self.interruptEvent.set()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    def get_deepl_translator(self, apiKey:str) -> Optional[deepl.Translator]:
+        #Checking the key costs a request, so each key is only checked once.
+        with self.deepLLock:
+            if apiKey not in self.deepLTranslators:
+                self.deepLTranslators[apiKey] = helper.get_deepl_translator(apiKey)
+            return self.deepLTranslators[apiKey]
+
+    def submit(self, request:TranslationRequest) -> concurrent.futures.Future:
+        #The future's result is the translated text, or None if the provider couldn't be reached.
+        request.submitTime = time.perf_counter()
+        with self.stopLock:
+            if self.interruptEvent.is_set():
+                request.future.set_exception(RuntimeError("The translation service was stopped."))
+            else:
+                self.requestQueue.put(request)
+        return request.future
+
+    def main_loop(self):
+        while True:
+            try:
+                requests = [self.requestQueue.get(timeout=1)]
+            except queue.Empty:
+                requests = list()
+            if self.interruptEvent.is_set():
+                helper.logger.debug("Translation service exiting...")
+                self.fail_pending(requests)
+                return
+            if len(requests) == 0:
+                continue
+
+            deadline = time.monotonic() + batchWindow
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    requests.append(self.requestQueue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            #Results come back through each request's future, so the order within a batch doesn't matter to anyone.
+            batches = dict()
+            for request in requests:
+                batches.setdefault((request.provider, request.deeplAPIKey, request.sourceLang, request.targetLang), list()).append(request)
+            if len(requests) > 1:
+                helper.logger.debug(f"Batched {len(requests)} translation requests into {len(batches)} calls.")
+            for batch in batches.values():
+                for start in range(0, len(batch), maxDeepLBatch):
+                    self.executor.submit(self.run_batch, batch[start:start + maxDeepLBatch])
+
+    def fail_pending(self, requests:list[TranslationRequest]):
+        #Whatever hasn't been sent off yet never will be, but a translator might still be waiting on it.
+        while True:
+            try:
+                requests.append(self.requestQueue.get_nowait())
+            except queue.Empty:
+                break
+        for request in requests:
+            request.future.set_exception(RuntimeError("The translation service was stopped."))
+        if len(requests) > 0:
+            helper.logger.debug(f"Dropped {len(requests)} pending translation requests on exit.")
+
+    def run_batch(self, batch:list[TranslationRequest]):
+        if batch[0].provider == "google":
+            #googletrans sends one request per text anyway, so there's nothing to gain from passing it the whole list.
+            for request in batch:
+                try:
+                    translatedText = self.translate_google(request.text, request.sourceLang, request.targetLang)
+                except Exception as e:
+                    self.finish_request(request, None, e)
+                    continue
+                self.finish_request(request, translatedText)
+            return
+
+        deepLTranslator = self.get_deepl_translator(batch[0].deeplAPIKey)
+        try:
+            results = helper.call_with_backoff(lambda: deepLTranslator.translate_text([request.text for request in batch],
+                                                                                      target_lang=batch[0].targetLang, source_lang=batch[0].sourceLang),
+                                               "deepl", helper.is_deepl_transient, maxAttempts=2)
+        except Exception as e:
+            for request in batch:
+                self.finish_request(request, None, e)
+            return
+        for request, result in zip(batch, results):
+            self.finish_request(request, result.text)
+
+    def finish_request(self, request:TranslationRequest, translatedText:Optional[str], exception:Optional[Exception]=None):
+        #Measured from when it was submitted, since the batching wait is part of what the translator sees.
+        self.providerSelector.add_sample(request.provider, request.languagePair, time.perf_counter() - request.submitTime, exception is not None or translatedText is None)
+        if exception is not None:
+            request.future.set_exception(exception)
+        else:
+            request.future.set_result(translatedText)
+
+    def translate_google(self, text:str, sourceLang:str, targetLang:str) -> str:
+        #Only a couple of attempts, since a late translation is nearly as bad as none. There's DeepL to fall back to anyway.
+        return helper.call_with_backoff(lambda: self.googleTranslator.translate(text, dest=targetLang, src=sourceLang).text,
+                                        "google", helper.is_google_transient, maxAttempts=2)
@@ -1,22 +1,30 @@
+import concurrent.futures
 import logging
 import queue
 import threading
+import time
 from dataclasses import dataclass
 from typing import Optional
 
-import googletrans
 import deepl
 from PyQt6.QtCore import pyqtSignal
 
+from interpreterComponents.languageRoutes import get_language_routes
+from interpreterComponents.translationMemory import get_translation_memory
+from interpreterComponents.translationService import TranslationRequest, TranslationService
 from utils import helper
 @dataclass
 class TranslatorParams:
     deeplAPIKey: str
     targetLang: str
+    translationMemory: bool = True  #Reuse earlier translations of the same phrase instead of asking the provider again.
+    hedging: bool = False           #Also ask the other provider when the first one is slower than usual, and take whichever answers first.
 class Translator:
     def __init__(self, params:TranslatorParams, tlQueue:queue.Queue, ttsQueue:queue.Queue):
         self.deepLTranslator:Optional[deepl.Translator] = None
-        self.googleTranslator: googletrans.Translator = googletrans.Translator()
+        self.deeplAPIKey:Optional[str] = None
+        #The clients live in the shared service, which batches the requests from both interpreters.
+        self.translationService = TranslationService.acquire()
         self.interruptEvent = threading.Event()
 
         langName, langCode = params.targetLang.lower().split(" - ")
@@ -28,36 +36,43 @@ class Translator:
         if langCode == "pt":
             langCode = "pt-br"
 
-        if params.deeplAPIKey is not None and params.deeplAPIKey != "":
-            self.deepLTranslator = helper.get_deepl_translator(params.deeplAPIKey)
+        try:
+            if params.deeplAPIKey is not None and params.deeplAPIKey != "":
+                self.deeplAPIKey = params.deeplAPIKey
+                self.deepLTranslator = self.translationService.get_deepl_translator(params.deeplAPIKey)
 
-        self.targetLang = None
+            self.languageRoutes = get_language_routes(self.deepLTranslator)
+        except Exception:
+            #Nobody's going to release it for us if we don't get constructed.
+            TranslationService.release()
+            raise
 
         # Let's check if the target language is supported by deepL.
-        deepLSupported = False
+        self.targetLang = None
         if self.deepLTranslator is not None:
-            for language in self.deepLTranslator.get_target_languages():
-                if language.code.lower() == langCode or language.name.lower() == langName:
-                    deepLSupported = True
-                    self.targetLang = {"code":language.code.lower(), "name":language.name.lower()}
-                    break
+            self.targetLang = self.languageRoutes.get_deepl_target(langCode, langName)
 
-        if not deepLSupported:
+        if self.targetLang is None:
             self.deepLTranslator = None #No deepL support.
-            for code, name in googletrans.LANGUAGES.items():
-                if langCode.lower() == code.lower() or langName.lower() == name.lower():
-                    self.targetLang = {"code": code.lower(), "name": name.lower()}
-                    break
+            self.targetLang = self.languageRoutes.get_google_target(langCode, langName)
 
         if self.targetLang is None:
+            TranslationService.release()
             raise ValueError("Neither google translate nor deepL support this language. Panic.")
 
+        self.googleTargetLang = self.targetLang["name"]
+        if "(" in self.googleTargetLang:
+            self.googleTargetLang = self.googleTargetLang[:self.googleTargetLang.index("(")].strip()
+
+        self.translationMemory = get_translation_memory() if params.translationMemory else None
+        self.hedging = params.hedging
+
         self.tlQueue = tlQueue
         self.ttsQueue = ttsQueue
     def main_loop(self, textReadySignal:pyqtSignal):
         while True:
             try:
-                tlData = self.tlQueue.get(timeout=10)
+                tlItems = [self.tlQueue.get(timeout=10)]
             except queue.Empty:
                 continue
             finally:
@@ -65,45 +80,114 @@ class Translator:
                     print("Translator exiting...")
                     return
 
-            textToTL = tlData["text"]
-            print(f"Translating from {tlData['lang']}...")
-            sourceLang = tlData["lang"].lower()
-            resultText = None
-            if self.deepLTranslator is not None:
-                #Assuming the language is a language name?
-                isSupported = False
-                for lang in self.deepLTranslator.get_source_languages():
-                    if sourceLang in lang.name.lower(): #This should handle when/if the legacy "english" option is removed
-                        isSupported = True
-                        sourceLang = lang.code.upper()
-                        break
-                if isSupported:
-                    #The source language is supported by deepL.
-                    resultText = self.deepLTranslator.translate_text(textToTL, target_lang=self.targetLang["code"].upper(), source_lang=sourceLang.upper())
-
-            if resultText is None:
-                #DeepL was unable to translate it. Use googletrans.
-                targetLang = self.targetLang["name"]
-                if "(" in targetLang:
-                    targetLang = targetLang[:targetLang.index("(")].strip()
-                counter = 0
-                while counter < 10:
-                    try:
-                        resultText = self.googleTranslator.translate(textToTL, dest=targetLang, src=sourceLang.lower())
-                        break
-                    except TypeError:
-                        counter += 1
-                if counter >= 10:
-                    helper.logger.error("Unable to contact google translate after 10 retries. Giving up.")
-
-            signalData = {
-                "recognized": textToTL,
-                "translated": resultText.text,
-                "startTime": tlData["startTime"],
-                "endTime": tlData["endTime"]
-            }
-
-            textReadySignal.emit(signalData)
-
-            helper.logger.debug(f"Done translating.")
-            self.ttsQueue.put(resultText.text)
+            #Anything else that piled up in the meantime is sent along with it, so the service can batch them together.
+            while True:
+                try:
+                    tlItems.append(self.tlQueue.get_nowait())
+                except queue.Empty:
+                    break
+
+            pendingTranslations = [self.start_translation(tlData) for tlData in tlItems]
+            #The results are handled in the order they were queued, whatever order they come back in.
+            for pending in pendingTranslations:
+                tlData = pending["tlData"]
+                translatedText, provider = self.finish_translation(pending)
+                if translatedText is None:
+                    helper.logger.error(f"Unable to translate: {tlData['text']}")
+                    continue
+                if self.translationMemory is not None and not pending["fromMemory"]:
+                    self.translationMemory.put(tlData["text"], tlData["lang"], self.targetLang["code"], provider, translatedText,
+                                               time.perf_counter() - pending["startTimes"][provider])
+
+                signalData = {
+                    "recognized": tlData["text"],
+                    "translated": translatedText,
+                    "startTime": tlData["startTime"],
+                    "endTime": tlData["endTime"],
+                    "continuationID": tlData.get("continuationID")
+                }
+
+                textReadySignal.emit(signalData)
+
+                helper.logger.debug(f"Done translating.")
+                self.ttsQueue.put(translatedText)
+
+    def start_translation(self, tlData:dict) -> dict:
+        #Sends the item off to whichever provider is currently fastest for its language pair, and returns its pending state.
+        textToTL = tlData["text"]
+        print(f"Translating from {tlData['lang']}...")
+        sourceLang = tlData["lang"].lower()
+        #Whisper gives us either a code or a name, the routing table knows both.
+        deepLSource = self.languageRoutes.get_deepl_source(sourceLang) if self.deepLTranslator is not None else None
+        googleSource = self.languageRoutes.get_google_source(sourceLang)
+        pending = {
+            "tlData": tlData,
+            "deepLSource": deepLSource,
+            "googleSource": googleSource,
+            "languagePair": f"{googleSource}>{self.targetLang['code']}",
+            "providers": ["deepl", "google"] if deepLSource is not None else ["google"],    #In order of preference.
+            "futures": dict(),
+            "startTimes": dict(),
+            "fromMemory": False
+        }
+
+        if self.translationMemory is not None:
+            for provider in pending["providers"]:
+                translatedText = self.translationMemory.get(textToTL, sourceLang, self.targetLang["code"], provider)
+                if translatedText is not None:
+                    helper.logger.debug("Found the translation in the translation memory.")
+                    future = concurrent.futures.Future()
+                    future.set_result(translatedText)
+                    pending.update(providers=[provider], futures={provider: future}, fromMemory=True)
+                    return pending
+
+        pending["providers"] = self.translationService.providerSelector.rank(pending["providers"], pending["languagePair"])
+        #Providers that are down go last, so we don't wait on them failing first.
+        pending["providers"].sort(key=lambda provider: helper.circuitBreakers[provider].is_open())
+        self.submit_to(pending, pending["providers"][0])
+        return pending
+
+    def submit_to(self, pending:dict, provider:str):
+        textToTL = pending["tlData"]["text"]
+        if provider == "deepl":
+            request = TranslationRequest(textToTL, provider, pending["deepLSource"].upper(), self.targetLang["code"].upper(), pending["languagePair"], self.deeplAPIKey)
+        else:
+            request = TranslationRequest(textToTL, provider, pending["googleSource"], self.googleTargetLang, pending["languagePair"])
+        pending["startTimes"][provider] = time.perf_counter()
+        pending["futures"][provider] = self.translationService.submit(request)
+
+    def finish_translation(self, pending:dict) -> tuple[Optional[str], Optional[str]]:
+        #Waits for the translation and returns it along with the provider it came from, or (None, None) if every provider failed.
+        #If hedging is on and the provider is slower than its p90, the next one is fired as well and whichever answers first wins.
+        remainingProviders = [provider for provider in pending["providers"] if provider not in pending["futures"]]
+        while True:
+            timeout = None
+            if self.hedging and len(remainingProviders) > 0:
+                latestProvider = max(pending["startTimes"], key=pending["startTimes"].get)
+                hedgeDelay = self.translationService.providerSelector.get_hedge_delay(latestProvider, pending["languagePair"])
+                if hedgeDelay is not None:
+                    timeout = max(hedgeDelay - (time.perf_counter() - pending["startTimes"][latestProvider]), 0)
+
+            futures = {future: provider for provider, future in pending["futures"].items()}
+            done, _ = concurrent.futures.wait(futures, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            if len(done) == 0:
+                helper.logger.debug(f"{', '.join(pending['futures'])} is slower than usual, also asking {remainingProviders[0]}.")
+                self.submit_to(pending, remainingProviders.pop(0))
+                continue
+
+            for future in done:
+                provider = futures[future]
+                try:
+                    translatedText = future.result()
+                except Exception as e:
+                    helper.logger.warning(f"Translation with {provider} failed: {e}")
+                    translatedText = None
+                if translatedText is not None:
+                    return translatedText, provider
+                pending["futures"].pop(provider)
+
+            if len(pending["futures"]) == 0:
+                if len(remainingProviders) == 0:
+                    return None, None
+                #Everything in flight failed, fall back to the next provider.
+                self.submit_to(pending, remainingProviders.pop(0))
@@ -32,12 +32,18 @@ from utils.customWidgets import *
 
 from configWindow import LabeledInput, ConfigDialog, ToggleButton, CenteredLabel, LocalizedCenteredLabel, SignalEmitter
 from interpreter import Interpreter
+from interpreterComponents.recognizer import RecognizerService
 
 
 class MainWindow(QtWidgets.QDialog):
+    talkSignal = pyqtSignal(bool)   #Push-to-talk hotkey state, emitted from the hotkey listener's thread.
     def __init__(self, parent=None):
         super(MainWindow, self).__init__(parent)
+        self.pushToTalk = False
+        self.hotkeyListener = None
+        self.talkSignal.connect(self.set_talking)
         self.transcript:Optional[dict] = None
+        self.continuations = dict()     #The latest (possibly split) utterance of each speaker, so the pieces can be shown together.
         self.micButton = None
         self.speakerButton = None
         self.activeLabels = None
@@ -66,12 +72,12 @@ class MainWindow(QtWidgets.QDialog):
     def reset_active_layout(self):
         self.activeLabels["you"]["recognized"].setText(helper.translate_ui_text("Your recognized text"))
         self.activeLabels["you"]["translated"].setText(helper.translate_ui_text("Your translated text"))
-        self.activeLabels["you"]["info"].setText("Click to mute yourself")
+        self.activeLabels["you"]["info"].setText("Hold to talk" if self.pushToTalk else "Click to mute yourself")
         self.activeLabels["them"]["recognized"].setText(helper.translate_ui_text("Their recognized text"))
         self.activeLabels["them"]["translated"].setText(helper.translate_ui_text("Their translated text"))
         self.activeLabels["them"]["info"].setText("Click to mute them")
         self.activeLabels["cloneProgress"].setText("Cloning progress...")
-        self.micButton.setColor(helper.colors_dict['green'])
+        self.micButton.setColor(helper.colors_dict['red'] if self.pushToTalk else helper.colors_dict['green'])
 
     def init_active_state(self):
         active_layout = QGridLayout()
@@ -109,6 +115,8 @@ class MainWindow(QtWidgets.QDialog):
 
 
         self.micButton.clicked.connect(self.micbutton_click)
+        self.micButton.pressed.connect(lambda: self.set_talking(True))
+        self.micButton.released.connect(lambda: self.set_talking(False))
         self.speakerButton.clicked.connect(self.speakerbutton_click)
 
         # Set active layout
@@ -377,30 +385,60 @@ class MainWindow(QtWidgets.QDialog):
         signalEmitter.signal.connect(lambda: messageBox.done(0))
         helper.log_usage_info("Before interpreter setup")
         from interpreter import RecognizerParams, DetectorParams, TranslatorParams, SynthesizerParams, ClonerParams
+        from interpreterComponents.rejector import RejectionParams
         def interpreter_setup():
+            #Streaming relies on word timestamps, so it's only available with local recognition.
+            streamingEnabled = settings.get("streaming_recognition", False) and settings["voice_recognition_type"] == 0
+            #Device and compute type that benchmarked fastest for the chosen model, if the benchmark has been run.
+            whisperConfig = settings.get("whisper_configs", dict()).get(helper.modelSizes[settings["model_size"]], dict())
             recognizerParams = RecognizerParams(
                 runLocal= settings["voice_recognition_type"] == 0,
                 apiKey = keyring.get_password("polyecho", "openai_api_key"),
-                modelSize=helper.modelSizes[settings["model_size"]]
+                modelSize=helper.modelSizes[settings["model_size"]],
+                device=whisperConfig.get("device"),
+                computeType=whisperConfig.get("computeType"),
+                batchWindow=float(settings.get("recognition_batch_window", 0.05)),
+                uploadCodec=settings.get("online_audio_codec", 0),
+                maxInFlight=int(settings.get("online_max_in_flight", 3)),
+                maxLatency=float(settings.get("recognition_max_latency", 10)),
+                idleTimeout=float(settings.get("recognizer_idle_timeout", 0)),
+                rejectionParams=RejectionParams(
+                    maxNoSpeechProb=settings.get("rejection_max_no_speech_prob", 0.7),
+                    minAvgLogprob=settings.get("rejection_min_avg_logprob", -1.0),
+                    maxCompressionRatio=settings.get("rejection_max_compression_ratio", 2.4),
+                    minDuration=settings.get("rejection_min_duration", 0.2),
+                    maxRepetition=settings.get("rejection_max_repetition", 0.7)
+                )
             )
 
             yourDetectorParams = DetectorParams(
                 inputDevice=settings["audio_input_device"],
                 energy_threshold=settings["my_loudness_threshold"],
                 pause_threshold=settings["my_pause_time"],
-                dynamic_energy_threshold=False
+                streaming=streamingEnabled,
+                semanticEndpointing=settings.get("semantic_endpointing", True),
+                partialTranscripts=settings.get("endpointing_partial_transcripts", False),
+                splitDuration=settings.get("utterance_split_duration", 10),
+                echoSuppression=settings.get("echo_suppression", True),
+                computeFeatures=settings["voice_recognition_type"] == 0,
+                pushToTalk=settings.get("push_to_talk", False),
+                speaker="you",
+                schedulerWeight=float(settings.get("your_recognition_weight", 1.0))
             )
 
             yourTranslatorParams = TranslatorParams(
                 deeplAPIKey=keyring.get_password("polyecho", "deepl_api_key") if settings["deepl_enabled"] else "",
-                targetLang=settings["your_output_language"]
+                targetLang=settings["your_output_language"],
+                translationMemory=settings.get("translation_memory", True),
+                hedging=settings.get("translation_hedging", False)
             )
 
             yourSynthesizerParams = SynthesizerParams(
                 apiKey = keyring.get_password("polyecho", "elevenlabs_api_key"),
                 outputDeviceName = yourVirtualOutput,
                 voiceID = settings["your_ai_voice"],
-                modelID = self.your_model.get_value()
+                modelID = self.your_model.get_value(),
+                loopbackDeviceName = virtualDevices["you"].get("input") if settings.get("echo_suppression", True) else None
             )
 
             self.yourInterpreter = Interpreter(recognizerParams, yourDetectorParams, yourTranslatorParams, yourSynthesizerParams)
@@ -410,19 +448,29 @@ class MainWindow(QtWidgets.QDialog):
                 inputDevice=theirVirtualInput,
                 energy_threshold=settings["their_loudness_threshold"],
                 pause_threshold=settings["their_pause_time"],
-                dynamic_energy_threshold=False
+                streaming=streamingEnabled,
+                semanticEndpointing=settings.get("semantic_endpointing", True),
+                partialTranscripts=settings.get("endpointing_partial_transcripts", False),
+                splitDuration=settings.get("utterance_split_duration", 10),
+                echoSuppression=settings.get("echo_suppression", True),
+                computeFeatures=settings["voice_recognition_type"] == 0,
+                speaker="them",
+                schedulerWeight=float(settings.get("their_recognition_weight", 1.0))
             )
 
             theirTranslatorParams = TranslatorParams(
                 deeplAPIKey=keyring.get_password("polyecho", "deepl_api_key") if settings["deepl_enabled"] else "",
-                targetLang=settings["their_output_language"]
+                targetLang=settings["their_output_language"],
+                translationMemory=settings.get("translation_memory", True),
+                hedging=settings.get("translation_hedging", False)
             )
 
             theirSynthesizerParams = SynthesizerParams(
                 apiKey=keyring.get_password("polyecho", "elevenlabs_api_key"),
                 outputDeviceName=yourVirtualOutput,
                 voiceID= settings["placeholder_ai_voice"] if cloneNew else self.voicePicker.combo_box.currentText(),
-                modelID = self.their_model.get_value()
+                modelID = self.their_model.get_value(),
+                loopbackDeviceName = virtualDevices["you"].get("input") if settings.get("echo_suppression", True) else None
             )
 
             if cloneNew:
@@ -445,6 +493,7 @@ class MainWindow(QtWidgets.QDialog):
         messageBox.exec()
         helper.logger.debug("Interpreter setup completed")
 
+        self.pushToTalk = settings.get("push_to_talk", False)
         self.set_state("active")
         self.reset_active_layout()
 
@@ -469,6 +518,33 @@ class MainWindow(QtWidgets.QDialog):
         self.yourInterpreter.begin_interpretation()
         #time.sleep(10)
         self.theirInterpreter.begin_interpretation()
+        if self.pushToTalk:
+            self.start_hotkey_listener()
+
+    def start_hotkey_listener(self):
+        hotkeyName = settings.get("push_to_talk_hotkey", "").strip().lower()
+        if hotkeyName == "":
+            return
+        try:
+            from utils.pushToTalk import PushToTalkHotkey
+        except ImportError:
+            helper.logger.warning("pynput is not installed, the push-to-talk hotkey is disabled. You can still hold the mic button.")
+            return
+
+        hotkey = PushToTalkHotkey.parse(hotkeyName)
+        if hotkey is None:
+            helper.logger.warning(f"Unknown push-to-talk hotkey {hotkeyName}, the hotkey is disabled.")
+            return
+
+        #The listener calls this on its own thread, so it goes through the signal to reach the UI.
+        self.hotkeyListener = PushToTalkHotkey(hotkey, self.talkSignal.emit)
+        self.hotkeyListener.start()
+        helper.logger.debug(f"Listening for the push-to-talk hotkey {hotkeyName}.")
+
+    def stop_hotkey_listener(self):
+        if self.hotkeyListener is not None:
+            self.hotkeyListener.stop()
+            self.hotkeyListener = None
 
 
 
@@ -493,8 +569,20 @@ class MainWindow(QtWidgets.QDialog):
 
     def setSpeechLabelsText(self, who, signalData:dict):
         try:
-            self.activeLabels[who]["recognized"].setText(signalData["recognized"])
-            self.activeLabels[who]["translated"].setText(signalData["translated"])
+            #Pieces of a split utterance share a continuation ID, and get stitched back into a single line.
+            continuation = self.continuations.get(who)
+            continuationID = signalData.get("continuationID")
+            isContinuation = continuationID is not None and continuation is not None and continuation["id"] == continuationID
+            if isContinuation:
+                continuation["recognized"] += " " + signalData["recognized"]
+                continuation["translated"] += " " + signalData["translated"]
+                signalData["startTime"] = continuation["startTime"]
+            else:
+                continuation = {"id": continuationID, "recognized": signalData["recognized"], "translated": signalData["translated"], "startTime": signalData["startTime"]}
+                self.continuations[who] = continuation
+
+            self.activeLabels[who]["recognized"].setText(continuation["recognized"])
+            self.activeLabels[who]["translated"].setText(continuation["translated"])
             self.micButton.resizeEvent(None)
             self.speakerButton.resizeEvent(None)
             if self.transcript is not None:
@@ -504,17 +592,27 @@ class MainWindow(QtWidgets.QDialog):
 
                     if "subtitles" not in self.transcript:
                         self.transcript["subtitles"] = list()
-                    content = f"Original: {signalData['recognized']}\nTranslated: {signalData['translated']}"
-                    newIndex=1
-                    if len(self.transcript["subtitles"]) > 0:
-                        newIndex = self.transcript["subtitles"][-1].index+1
+                        self.transcript["offsets"] = list()     #Where each subtitle starts in the file, in the order they were written.
+                    subtitles = self.transcript["subtitles"]
+                    content = f"Original: {continuation['recognized']}\nTranslated: {continuation['translated']}"
+                    position = len(subtitles)
+                    if isContinuation:
+                        #Replace the subtitle for the earlier pieces. It's identified by its start time, and is almost always the last one.
+                        position = next((i for i in reversed(range(len(subtitles))) if subtitles[i].start == signalData["startTime"]), position)
+                    newIndex = subtitles[position].index if position < len(subtitles) else len(subtitles)+1
                     newSub = Subtitle(index=newIndex, start=signalData["startTime"],end=signalData["endTime"], content=srt.make_legal_content(content))
-                    self.transcript["subtitles"].append(newSub)
 
-                    #Let's ensure they're all ordered properly:
-                    self.transcript["subtitles"] = list(srt.sort_and_reindex(self.transcript["subtitles"]))
-
-                    self.transcript["file"].write(newSub.to_srt(strict=False))
+                    #Only what comes after the replaced subtitle gets rewritten. The finalized (sorted) version is written when the session stops.
+                    if position < len(subtitles):
+                        subtitles[position] = newSub
+                        self.transcript["file"].seek(self.transcript["offsets"][position])
+                        self.transcript["file"].truncate()
+                        del self.transcript["offsets"][position:]
+                    else:
+                        subtitles.append(newSub)
+                    for subtitle in subtitles[position:]:
+                        self.transcript["offsets"].append(self.transcript["file"].tell())
+                        self.transcript["file"].write(subtitle.to_srt(strict=False))
                     self.transcript["file"].flush()
         except RuntimeError as e:
             pass
@@ -522,8 +620,19 @@ class MainWindow(QtWidgets.QDialog):
 
 
 
+    def set_talking(self, talking:bool):
+        if not self.pushToTalk or self.yourInterpreter is None or self.yourInterpreter.talking == talking:
+            return
+        #Releasing sends the utterance off right away, there's no pause to wait for.
+        self.yourInterpreter.talking = talking
+        self.activeLabels["you"]["info"].setText("Release to send" if talking else "Hold to talk")
+        self.micButton.setColor(helper.colors_dict['green'] if talking else helper.colors_dict['red'])
+
     def micbutton_click(self):
         helper.logger.debug("Clicked mic button")
+        if self.pushToTalk:
+            #In push-to-talk mode the button is held instead, see set_talking.
+            return
         if self.micButton.getColor() == helper.colors_dict['red']:
             #Already paused
             helper.logger.debug("Unpausing mic")
@@ -579,6 +688,8 @@ class MainWindow(QtWidgets.QDialog):
                     self.voicePicker.combo_box.setCurrentIndex(0)
                 self.adjustSize()
 
+        self.stop_hotkey_listener()
+        self.set_talking(False)
         self.yourInterpreter.detector_paused = False
         self.theirInterpreter.synthetizer_paused = False
 
@@ -704,6 +815,9 @@ def main():
 
     app.exec()
 
+    #Unload the whisper model (if it's still loaded) so the app can exit.
+    RecognizerService.shutdown()
+
     try:
         for widget in dialog.iterate_widgets(dialog.layout):
             if hasattr(widget, 'configKey'):
@@ -0,0 +1,5 @@
+import os
+import sys
+
+#The modules import each other from the repo root (utils.helper, interpreterComponents...), same as when running polyEcho.py.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
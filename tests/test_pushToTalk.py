@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+
+import pytest
+
+if sys.platform.startswith("linux") and "DISPLAY" not in os.environ:
+    #No X server to listen to, the listener below delivers the events itself anyway.
+    os.environ.setdefault("PYNPUT_BACKEND", "dummy")
+keyboard = pytest.importorskip("pynput.keyboard")
+
+from utils.pushToTalk import PushToTalkHotkey
+
+
+class FakeBackendListener(keyboard.Listener):
+    #Delivers events the same way the platform backends do (a callback returning False stops it), without needing a display.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stopEvent = threading.Event()
+
+    def _run(self):
+        self._mark_ready()
+        self.stopEvent.wait()
+
+    def _stop_platform(self):
+        self.stopEvent.set()
+
+    @keyboard.Listener._emitter
+    def feed(self, key):
+        self.on_press(key)
+        self.on_release(key)
+
+
+@pytest.fixture
+def hotkey(monkeypatch):
+    monkeypatch.setattr(keyboard, "Listener", FakeBackendListener)
+    events = list()
+    hotkey = PushToTalkHotkey(PushToTalkHotkey.parse("f8"), events.append)
+    hotkey.events = events
+    hotkey.start().wait()
+    yield hotkey
+    hotkey.stop()
+
+
+def test_other_keys_keep_the_listener_running(hotkey):
+    listener = hotkey.listener
+    listener.feed(keyboard.KeyCode.from_char("a"))
+    listener.feed(keyboard.KeyCode.from_char("b"))
+    assert listener.running
+    assert hotkey.events == []
+
+
+def test_hotkey_emits_press_and_release(hotkey):
+    listener = hotkey.listener
+    listener.feed(keyboard.KeyCode.from_char("a"))
+    listener.feed(keyboard.Key.f8)
+    assert listener.running
+    assert hotkey.events == [True, False]
+
+
+def test_parse():
+    assert PushToTalkHotkey.parse(" F8 ") == keyboard.Key.f8
+    assert PushToTalkHotkey.parse("x") == keyboard.KeyCode.from_char("x")
+    assert PushToTalkHotkey.parse("not a key") is None
@@ -0,0 +1,58 @@
+import datetime
+import queue
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+from faster_whisper.transcribe import Segment, TranscriptionInfo, Word
+
+from interpreterComponents import recognizer
+from interpreterComponents.recognizer import Recognizer, RecognizerParams
+
+
+class FakeModel:
+    #Always hears the same confident Spanish, and remembers which language it was told to use.
+    def __init__(self, *args, **kwargs):
+        self.forcedLanguages = list()
+
+    def transcribe(self, audio, language=None, **kwargs):
+        self.forcedLanguages.append(language)
+        words = [Word(0.0, 0.4, " Hola", 0.9), Word(0.5, 0.9, " amigos", 0.9)]
+        segment = Segment(0, 0, 0.0, 1.0, " Hola amigos", [], 0.0, -0.2, 1.2, 0.01, words)
+        info = TranscriptionInfo(language=language or "es", language_probability=1.0 if language else 0.98, duration=audio.shape[0] / 16000,
+                                 all_language_probs=None, transcription_options=None, vad_options=None)
+        return iter([segment]), info
+
+
+@pytest.fixture
+def streamingRecognizer(monkeypatch):
+    monkeypatch.setattr(recognizer.faster_whisper, "WhisperModel", FakeModel)
+    return Recognizer(RecognizerParams(runLocal=True, modelSize="tiny", device="cpu", computeType="int8"))
+
+
+def make_chunk(streamID:int, final:bool, resultQueue:queue.Queue) -> dict:
+    return {"streamID": streamID, "final": final, "audio": np.zeros(16000, dtype=np.float32), "endTime": datetime.datetime.now(),
+            "queue": resultQueue, "speaker": "you"}
+
+
+def test_streamed_decodes_lock_the_language(streamingRecognizer):
+    resultQueue = queue.Queue()
+    for streamID in range(recognizer.languageLockCount):
+        streamingRecognizer.process_stream_chunk(make_chunk(streamID, True, resultQueue))
+
+    languageState = streamingRecognizer.speakerLanguages["you"]
+    assert languageState["locked"]
+    assert languageState["language"] == "es"
+    assert resultQueue.qsize() == recognizer.languageLockCount
+
+    #From here on the streamed decodes use the locked language.
+    streamingRecognizer.process_stream_chunk(make_chunk(recognizer.languageLockCount, True, resultQueue))
+    assert streamingRecognizer.model.forcedLanguages[-1] == "es"
+
+
+def test_uncommitted_stream_decodes_dont_count(streamingRecognizer):
+    #The first chunk of a phrase has no earlier hypothesis to agree with, so nothing gets committed.
+    streamingRecognizer.process_stream_chunk(make_chunk(0, False, queue.Queue()))
+    assert "you" not in streamingRecognizer.speakerLanguages
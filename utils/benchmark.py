@@ -0,0 +1,150 @@
+import datetime
+import gc
+import json
+import os
+import time
+from typing import Callable, Optional
+
+import ctranslate2
+import faster_whisper
+import psutil
+import pynvml
+
+from interpreterComponents.recognizer import RecognizerService
+from utils import helper
+
+benchmarkResultsPath = os.path.join(helper.cacheDir, "benchmark.json")
+modelsDir = os.path.join(helper.cacheDir, "faster-whisper")
+#11 seconds of JFK's inaugural address (public domain), the same clip whisper.cpp uses for its samples.
+bundledSamplePath = os.path.join(helper.resourcesDir, "benchmark_sample.mp3")
+
+computeTypes = ["int8", "int8_float16", "float16", "float32"]
+#The recommended setting has to transcribe at least this fast (processing time / audio duration).
+defaultTargetRTF = 0.3
+
+def get_benchmark_sample() -> Optional[str]:
+    if not os.path.exists(bundledSamplePath):
+        helper.logger.error(f"The benchmark sample is missing ({bundledSamplePath}).")
+        return None
+    return bundledSamplePath
+
+def get_downloaded_model_sizes() -> list[str]:
+    #Only the models that are already downloaded get benchmarked, we don't want to pull several GB just for this.
+    downloadedSizes = list()
+    for modelSize in helper.modelSizes:
+        modelDir = os.path.join(modelsDir, "models--guillaumekln--faster-whisper-" + modelSize)
+        if os.path.exists(modelDir) and helper.find_model_bin(modelDir):
+            downloadedSizes.append(modelSize)
+    return downloadedSizes
+
+def get_candidate_configs() -> list[tuple[str, str]]:
+    devices = ["cpu"]
+    if ctranslate2.get_cuda_device_count() > 0:
+        devices.insert(0, "cuda")
+
+    candidates = list()
+    for device in devices:
+        supportedTypes = ctranslate2.get_supported_compute_types(device)
+        for computeType in computeTypes:
+            if computeType in supportedTypes:
+                candidates.append((device, computeType))
+    return candidates
+
+def get_memory_usage(device:str) -> int:
+    if device == "cuda":
+        try:
+            pynvml.nvmlInit()
+            return pynvml.nvmlDeviceGetMemoryInfo(pynvml.nvmlDeviceGetHandleByIndex(0)).used
+        except pynvml.NVMLError:
+            return 0
+    return psutil.Process(os.getpid()).memory_info().rss
+
+def benchmark_config(audio, modelSize:str, device:str, computeType:str) -> dict:
+    baseMemory = get_memory_usage(device)
+    model = faster_whisper.WhisperModel(modelSize, device=device, compute_type=computeType, download_root=modelsDir)
+    try:
+        #Warm up on a short slice first, so the one-off initialization doesn't count towards the timing.
+        list(model.transcribe(audio[:5 * helper.whisperSampleRate], beam_size=5)[0])
+
+        startTime = time.perf_counter()
+        segments, info = model.transcribe(audio, beam_size=5, vad_filter=True)
+        list(segments)
+        elapsedTime = time.perf_counter() - startTime
+        memoryUsed = max(get_memory_usage(device) - baseMemory, 0)
+    finally:
+        del model
+        gc.collect()
+
+    return {
+        "modelSize": modelSize,
+        "device": device,
+        "computeType": computeType,
+        "rtf": elapsedTime / info.duration,
+        "memoryGB": round(memoryUsed / pow(10, 9), 2)
+    }
+
+def pick_fastest_configs(results:list[dict]) -> dict:
+    #The fastest device/compute type for each model size.
+    fastestConfigs = dict()
+    for result in sorted(results, key=lambda result: result["rtf"]):
+        if result["modelSize"] not in fastestConfigs:
+            fastestConfigs[result["modelSize"]] = {"device": result["device"], "computeType": result["computeType"]}
+    return fastestConfigs
+
+def pick_recommended(results:list[dict], targetRTF:float) -> Optional[dict]:
+    #The most accurate model that still meets the target, using its fastest compute type.
+    #If nothing meets the target, just go with the fastest setting overall.
+    if len(results) == 0:
+        return None
+    viableResults = [result for result in results if result["rtf"] <= targetRTF]
+    if len(viableResults) == 0:
+        return min(results, key=lambda result: result["rtf"])
+    largestSize = max(helper.modelSizes.index(result["modelSize"]) for result in viableResults)
+    return min([result for result in viableResults if helper.modelSizes.index(result["modelSize"]) == largestSize], key=lambda result: result["rtf"])
+
+def run_benchmark(progressCallback:Optional[Callable[[int], None]]=None, targetRTF:float=defaultTargetRTF) -> Optional[dict]:
+    #The recognizer kept loaded between sessions would skew the numbers, and loading a second copy could run out of VRAM.
+    if not RecognizerService.unload_if_idle():
+        helper.logger.error("Can't benchmark while an interpretation session is running.")
+        return None
+    samplePath = get_benchmark_sample()
+    if samplePath is None:
+        return None
+    audio = faster_whisper.decode_audio(samplePath, sampling_rate=helper.whisperSampleRate)
+
+    configs = [(modelSize, device, computeType) for modelSize in get_downloaded_model_sizes() for device, computeType in get_candidate_configs()]
+    results = list()
+    for index, (modelSize, device, computeType) in enumerate(configs):
+        helper.logger.debug(f"Benchmarking {modelSize} on {device} with {computeType}...")
+        try:
+            result = benchmark_config(audio, modelSize, device, computeType)
+            helper.logger.info(f"Benchmark result: {result}")
+            results.append(result)
+        except (RuntimeError, ValueError) as e:
+            #Usually means we ran out of memory, or the compute type isn't actually usable on this device.
+            helper.logger.warning(f"Benchmark of {modelSize} on {device} with {computeType} failed: {e}")
+        if progressCallback is not None:
+            progressCallback(int((index + 1) / len(configs) * 100))
+
+    benchmarkData = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "targetRTF": targetRTF,
+        "results": results,
+        "recommended": pick_recommended(results, targetRTF)
+    }
+    os.makedirs(helper.cacheDir, exist_ok=True)
+    with open(benchmarkResultsPath, "w", encoding="utf8") as fp:
+        json.dump(benchmarkData, fp, indent=4)
+
+    #The model size itself is left up to the user (the UI suggests the recommended one), but whichever one they pick
+    #gets loaded with the device and compute type that benchmarked fastest for it.
+    helper.logger.info(f"Recommended recognition setting: {benchmarkData['recommended']}")
+    helper.settings["whisper_configs"] = pick_fastest_configs(results)
+    helper.dump_settings()
+    return benchmarkData
+
+def load_benchmark_results() -> Optional[dict]:
+    if not os.path.exists(benchmarkResultsPath):
+        return None
+    with open(benchmarkResultsPath, "r", encoding="utf8") as fp:
+        return json.load(fp)
@@ -43,7 +43,7 @@ class LocalizedCheckbox(QtWidgets.QCheckBox):
         self.cacheSkip = cacheSkip
         self.configKey = configKey
         if configKey not in settings:
-            settings[configKey] = False
+            settings[configKey] = helper.default_settings.get(configKey, False)
         self.setChecked(settings[configKey])
 
     def setText(self, a0: str) -> None:
@@ -670,6 +670,22 @@ class ModelDownloadThread(DownloadThread):
         sys.stderr = oldStdErr
         self.doneSignal.emit()
 
+class BenchmarkThread(DownloadThread):
+    def __init__(self):
+        super().__init__()
+        self.benchmarkData = None
+    def run(self):
+        try:
+            from utils import benchmark
+            self.setProgressBarTotalSignal.emit(100)
+            self.benchmarkData = benchmark.run_benchmark(progressCallback=self.updateProgressSignal.emit, targetRTF=float(settings.get("benchmark_target_rtf", benchmark.defaultTargetRTF)))
+        except Exception as e:
+            helper.logger.error("The benchmark failed, the default recognition settings will be used.")
+            helper.logger.exception(e)
+        finally:
+            #Otherwise the dialog never closes.
+            self.doneSignal.emit()
+
 class ProgressDialog(QtWidgets.QDialog):
     def __init__(self, baseLabelText, downloadThread:DownloadThread):
         super().__init__()
@@ -730,6 +746,15 @@ class ModelDownloadDialog(ProgressDialog):
     def __init__(self, baseLabelText, modelSize):
         super().__init__(baseLabelText, ModelDownloadThread(modelSize))
 
+class BenchmarkDialog(ProgressDialog):
+    def __init__(self, baseLabelText="Benchmarking speech recognition, this may take a few minutes..."):
+        super().__init__(baseLabelText, BenchmarkThread())
+        self.setWindowTitle(helper.translate_ui_text('Benchmark'))
+
+    @property
+    def benchmarkData(self) -> Optional[dict]:
+        return self.download_thread.benchmarkData
+
 class DownloadDialog(ProgressDialog):
     def __init__(self, baseLabelText, url, location):
         super().__init__(baseLabelText, FileDownloadThread(url, location))
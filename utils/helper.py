@@ -2,16 +2,21 @@ from __future__ import annotations
 import json
 import os
 import platform
+import random
 import re
+import threading
+import time
 import webbrowser
-from typing import Union, Optional
+from typing import Callable, Union, Optional
 
 import deepl
 import elevenlabslib
 import googletrans
 import httpcore
+import httpx
 import psutil
 import logging
+import numpy as np
 import pynvml
 import sounddevice
 import unicodedata
@@ -42,8 +47,16 @@ styleSheetPath = os.path.join(resourcesDir, "stylesheet.qss")
 tlCachePath =  os.path.join(resourcesDir, "tlcache.json")
 
 modelSizes = ["base", "small", "medium", "large-v2"]
-
-translator = googletrans.Translator()
+whisperSampleRate = 16000
+
+#A single googletrans client for the whole process, so its keep-alive connections get reused by everything.
+#The timeout is there so an outage fails fast instead of hanging whoever's waiting on it.
+googleTimeout = 5.0
+translator = googletrans.Translator(timeout=httpx.Timeout(googleTimeout))
+#DeepL's own client retries for up to a minute with at least 10s per attempt, which is far too long to hold up a conversation.
+#call_with_backoff does the retrying instead.
+deepl.http_client.max_network_retries = 0
+deepl.http_client.min_connection_timeout = 5.0
 with open(langNamesPath, "r", encoding="utf8") as fp:
     languages_translated = json.load(fp)
 
@@ -69,7 +82,29 @@ default_settings = {
     "transcription_storage": 0,
     "ui_language": "System Language - syslang",
     "their_loudness_threshold": "250",
-    "their_pause_time": "0.5"
+    "their_pause_time": "0.5",
+    "semantic_endpointing": True,
+    "endpointing_partial_transcripts": False,
+    "utterance_split_duration": "10",
+    "streaming_recognition": False,
+    "echo_suppression": True,
+    "push_to_talk": False,
+    "push_to_talk_hotkey": "",
+    "translation_memory": True,
+    "translation_hedging": False,
+    "recognition_batch_window": 0.05,
+    "recognition_max_latency": 10,
+    "recognizer_idle_timeout": 0,
+    "your_recognition_weight": 1.0,
+    "their_recognition_weight": 1.0,
+    "online_audio_codec": 0,
+    "online_max_in_flight": "3",
+    "rejection_max_no_speech_prob": 0.7,
+    "rejection_min_avg_logprob": -1.0,
+    "rejection_max_compression_ratio": 2.4,
+    "rejection_min_duration": 0.2,
+    "rejection_max_repetition": 0.7,
+    "benchmark_target_rtf": 0.3
 }
 
 
@@ -107,8 +142,11 @@ def reload_settings():
     if os.path.exists("config.json"):
         with open("config.json", "r", encoding="utf8") as fp:
             settings = json.load(fp)
+        #Configs from older versions don't have the newer keys, and the widgets need their real defaults rather than a blank.
+        for key, value in default_settings.items():
+            settings.setdefault(key, value)
     else:
-        settings = default_settings
+        settings = dict(default_settings)
         with open("config.json", "w", encoding="utf8") as fp:
             json.dump(settings, fp, indent=4)
 
@@ -145,18 +183,12 @@ def get_googletrans_native_langnames(currentLang):
             langList.append(f"{languages_translated[code]} - {code}")
         else:
             #It's not in the TL'd languages json. TL it and add it.
-            counter = 0
             translated_name = None
-            while counter < 10:
-                try:
-                    logger.debug(f"Couldn't find {name} ({code}), translating it...")
-                    translated_name = translator.translate(name, dest=code).text
-                    break
-                except TypeError:
-                    counter += 1
-                except httpcore.TimeoutException:
-                    logger.error("Timeout error when trying to use google translate. Not going to translate.")
-                    break
+            try:
+                logger.debug(f"Couldn't find {name} ({code}), translating it...")
+                translated_name = call_with_backoff(lambda: translator.translate(name, dest=code).text, "google", is_google_transient)
+            except (CircuitOpenError,) + googleErrors as e:
+                logger.error(f"Unable to use google translate ({e!r}). Not going to translate.")
 
             if translated_name is not None:
                 first_char = translated_name[0]
@@ -216,22 +248,13 @@ def tl_cache_prep(target_language):
     # Translate all text into the target language
     translations = list()
     for chunk in chunks:
-        chunk_translations = None
-        for i in range(20):
-            try:
-                chunk_translations:list = translator.translate(chunk, dest=langCode).text.split(marker)
-                #Remove all the empty items
-                while True:
-                    try:
-                        chunk_translations.remove("")
-                    except ValueError:
-                        break
-                break
-            except (TypeError, httpcore.TimeoutException):
-                pass
-        if chunk_translations is None:
-            logger.error("Could not contact googletrans after 20 tries. Giving up.")
+        try:
+            chunk_translations:list = call_with_backoff(lambda: translator.translate(chunk, dest=langCode).text, "google", is_google_transient).split(marker)
+        except (CircuitOpenError,) + googleErrors as e:
+            logger.error(f"Could not contact googletrans ({e!r}). Giving up.")
             return
+        #Remove all the empty items
+        chunk_translations = [translation for translation in chunk_translations if translation != ""]
         translations.extend(chunk_translations)
 
     #SANITY CHECK: Do we have the same amount of lines? If not, give up on the TL cache.
@@ -267,23 +290,16 @@ def translate_ui_text(text, cacheKey=None, cacheSkip=False, languageOverride=Non
     if langCode not in tlCache[cacheKey] or cacheSkip:
         cacheUpdated = True
 
-        counter = 0
         translatedText = None
-        while counter < 10:
+        if "en" in langCode.lower():
+            translatedText = text
+        else:
             try:
-                if "en" in langCode.lower():
-                    translatedText = text
-                else:
-                    translatedText = translator.translate(text, dest=langCode).text
-                break
-            except TypeError:
-                counter += 1
-            except httpcore.TimeoutException:
-                logger.error("Timeout error when trying to use google translate. Not going to translate.")
-                break
+                translatedText = call_with_backoff(lambda: translator.translate(text, dest=langCode).text, "google", is_google_transient)
+            except (CircuitOpenError,) + googleErrors as e:
+                logger.error(f"Failed to get translation ({e!r}). Not translating.")
 
         if translatedText is None:
-            logger.error("Failed to get translation. Not translating.")
             translatedText = text
             translatedText = translatedText[0].upper() + translatedText[1:]
         else:
@@ -472,6 +488,100 @@ def get_virtual_devices() -> dict:
 
     return devices
 
+#googletrans raises these when google answers with something unexpected or can't be reached. Any status other than 200
+#(rate limiting, server errors) ends up as an AttributeError, and an error page instead of the usual response as a JSON error.
+googleTransientErrors = (TypeError, AttributeError, IndexError, json.JSONDecodeError, httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError)
+#Everything it can raise, including the ones retrying won't fix (a plain ValueError means an invalid language code).
+googleErrors = googleTransientErrors + (ValueError,)
+deeplTransientErrors = (deepl.ConnectionException, deepl.TooManyRequestsException)
+
+def is_google_transient(e:Exception) -> bool:
+    return isinstance(e, googleTransientErrors)
+
+def is_deepl_transient(e:Exception) -> bool:
+    #Server errors come as a plain DeepLException, so those are told apart by the status code.
+    return isinstance(e, deeplTransientErrors) or (isinstance(e, deepl.DeepLException) and (e.http_status_code or 0) >= 500)
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    #Stops calling a provider that keeps failing. After failureThreshold failures in a row every call fails instantly
+    #for resetTimeout seconds, then a single trial call is let through to check whether it's back.
+    def __init__(self, name:str, failureThreshold:int=5, resetTimeout:float=30.0):
+        self.name = name
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.openedAt = None
+        self.trialInFlight = False
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.openedAt is not None and (self.trialInFlight or time.monotonic() - self.openedAt < self.resetTimeout)
+
+    def allow_request(self) -> bool:
+        with self.lock:
+            if self.openedAt is None:
+                return True
+            if self.trialInFlight or time.monotonic() - self.openedAt < self.resetTimeout:
+                return False
+            self.trialInFlight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.openedAt is not None:
+                logger.info(f"{self.name} is reachable again.")
+            self.failures = 0
+            self.openedAt = None
+            self.trialInFlight = False
+
+    def record_failure(self, transient:bool=True):
+        #Errors that aren't transient (a bad request and such) don't say anything about whether the provider is up,
+        #except during the trial, where anything short of a success keeps it open.
+        with self.lock:
+            if transient or self.trialInFlight:
+                self.failures += 1
+            if self.trialInFlight or (transient and self.openedAt is None and self.failures >= self.failureThreshold):
+                logger.warning(f"{self.name} failed {self.failures} times in a row, not trying it again for {self.resetTimeout:.0f}s.")
+                self.openedAt = time.monotonic()
+            self.trialInFlight = False
+
+circuitBreakers = {"google": CircuitBreaker("Google Translate"), "deepl": CircuitBreaker("DeepL")}
+
+def call_with_backoff(function, breakerName:str, isTransient:Callable[[Exception], bool], maxAttempts:int=4, baseDelay:float=0.25, maxDelay:float=4.0):
+    #Calls function, retrying with exponential backoff and full jitter on the exceptions isTransient accepts. Any other one is raised right away.
+    #Raises CircuitOpenError right away if the provider's circuit breaker is open, or the last exception once the attempts run out.
+    breaker = circuitBreakers[breakerName]
+    lastException = None
+    for attempt in range(maxAttempts):
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"{breaker.name} is currently unavailable.")
+        succeeded = False
+        transient = True
+        try:
+            result = function()
+            succeeded = True
+        except Exception as e:
+            transient = isTransient(e)
+            if not transient:
+                raise
+            lastException = e
+            logger.debug(f"{breaker.name} call failed (attempt {attempt + 1}/{maxAttempts}): {e!r}")
+        finally:
+            #Always exactly one of these, however the call ended, or a trial call could hold the breaker open for good.
+            if succeeded:
+                breaker.record_success()
+            else:
+                breaker.record_failure(transient)
+        if succeeded:
+            return result
+        if attempt < maxAttempts - 1:
+            time.sleep(random.uniform(0, min(maxDelay, baseDelay * 2 ** attempt)))
+    raise lastException
+
 maxAPIRetries = 3
 def get_xi_user(apiKey, exitOnFail=True) -> Optional[elevenlabslib.ElevenLabsUser]:
     errorMessage = ""
@@ -537,6 +647,13 @@ def find_model_bin(root_dir):
                     return True
     return False  # "model.bin" not found in any directories, return False
 
+def pcm_to_float32(pcmData) -> np.ndarray:
+    #Takes 16 bit mono PCM (bytes or any buffer) and returns the float32 samples whisper works with.
+    return np.frombuffer(pcmData, dtype=np.int16).astype(np.float32) / 32768.0
+
+def float32_to_pcm(audio:np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
 def show_msgbox_and_exit(text, url=None, urlBtnText=None, exitCode=1):
     logger.error(f"Requested exit with message {text}")
     msgBox = QtWidgets.QMessageBox()
@@ -0,0 +1,46 @@
+from typing import Callable, Optional, Union
+
+from pynput import keyboard
+
+
+class PushToTalkHotkey:
+    #Global hotkey for push-to-talk. onTalk gets called with True when it's pressed and False when it's released,
+    #from the listener's own thread.
+    def __init__(self, hotkey:Union[keyboard.Key, keyboard.KeyCode], onTalk:Callable[[bool], None]):
+        self.hotkey = hotkey
+        self.onTalk = onTalk
+        self.listener:Optional[keyboard.Listener] = None
+
+    @staticmethod
+    def parse(hotkeyName:str) -> Optional[Union[keyboard.Key, keyboard.KeyCode]]:
+        #Either a special key ("f8", "ctrl_r") or a single character. Returns None if it's neither.
+        hotkeyName = hotkeyName.strip().lower()
+        if hotkeyName in keyboard.Key.__members__:
+            return keyboard.Key[hotkeyName]
+        if len(hotkeyName) == 1:
+            return keyboard.KeyCode.from_char(hotkeyName)
+        return None
+
+    def matches(self, key) -> bool:
+        if isinstance(key, keyboard.KeyCode) and key.char is not None:
+            return isinstance(self.hotkey, keyboard.KeyCode) and key.char.lower() == self.hotkey.char
+        return key == self.hotkey
+
+    #pynput stops the listener as soon as a callback returns False, so these must never return anything.
+    def on_press(self, key) -> None:
+        if self.matches(key):
+            self.onTalk(True)
+
+    def on_release(self, key) -> None:
+        if self.matches(key):
+            self.onTalk(False)
+
+    def start(self) -> keyboard.Listener:
+        self.listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+        self.listener.start()
+        return self.listener
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None